@@ -1,10 +1,10 @@
-d3.json('data/simulation_results_20250410_093155.json').then(function(simulations) {
+// Bottleneck counts come pre-aggregated from the simulator's summary file (Simulator/summary.py).
+d3.json('data/simulator.summary.json').then(function(summary) {
     const nWorkstations = 6;
     let frequencies = Array(nWorkstations).fill(0);
 
-    simulations.forEach(sim => {
-        const station = sim.bottleneck_workstations.bottleneck_station;
-        frequencies[station] += 1;
+    summary.bottleneck_counts.forEach((count, station) => {
+        frequencies[station] = count;
     });
 
     const data = frequencies.map((count, i) => ({ label: `WS ${i}`, count: count }));
@@ -1,17 +1,22 @@
-d3.json("data/simulation_results_20250410_093155.json").then(function(data) {
-    const rejectionData = data.map(d => d.production_rejection_percentage).sort(d3.ascending);
+// Quantiles and histogram come pre-aggregated from the simulator's summary file (Simulator/summary.py).
+d3.json("data/simulator.summary.json").then(function(summary) {
+    const rejection = summary.metrics.production_rejection_percentage;
 
-    const q1 = d3.quantile(rejectionData, 0.25);
-    const median = d3.quantile(rejectionData, 0.5);
-    const q3 = d3.quantile(rejectionData, 0.75);
+    const q1 = rejection.quantiles["0.25"];
+    const median = rejection.quantiles["0.5"];
+    const q3 = rejection.quantiles["0.75"];
     const iqr = q3 - q1;
     const lowerWhisker = q1 - 1.5 * iqr;
     const upperWhisker = q3 + 1.5 * iqr;
-    const min = d3.min(rejectionData);
-    const max = d3.max(rejectionData);
+    const min = rejection.min;
+    const max = rejection.max;
 
-    const outliers = rejectionData.filter(d => d < lowerWhisker || d > upperWhisker);
-    const nonOutliers = rejectionData.filter(d => d >= lowerWhisker && d <= upperWhisker);
+    // Outliers are drawn per histogram bin, at the bin center.
+    const histogram = rejection.histogram;
+    const outliers = Object.entries(histogram.bins)
+        .map(([index, count]) => ({ value: (+index + 0.5) * histogram.width, count: count }))
+        .filter(d => d.value < lowerWhisker || d.value > upperWhisker);
+    const whiskers = [Math.max(min, lowerWhisker), Math.min(max, upperWhisker)];
 
     const width = 600;
     const height = 350;
@@ -33,8 +38,8 @@ d3.json("data/simulation_results_20250410_093155.json").then(function(data) {
     const boxWidth = 140;
 
     chart.append("line")
-        .attr("x1", x(Math.max(d3.min(nonOutliers), lowerWhisker)))
-        .attr("x2", x(Math.min(d3.max(nonOutliers), upperWhisker)))
+        .attr("x1", x(whiskers[0]))
+        .attr("x2", x(whiskers[1]))
         .attr("y1", centerY)
         .attr("y2", centerY)
         .attr("stroke", "black");
@@ -55,7 +60,7 @@ d3.json("data/simulation_results_20250410_093155.json").then(function(data) {
         .attr("stroke", "black")
         .attr("stroke-width", 2);
 
-    [Math.max(d3.min(nonOutliers), lowerWhisker), Math.min(d3.max(nonOutliers), upperWhisker)].forEach(val => {
+    whiskers.forEach(val => {
         chart.append("line")
             .attr("x1", x(val))
             .attr("x2", x(val))
@@ -81,7 +86,7 @@ d3.json("data/simulation_results_20250410_093155.json").then(function(data) {
         .enter()
         .append("circle")
         .attr("class", "outlier")
-        .attr("cx", d => x(d))
+        .attr("cx", d => x(d.value))
         .attr("cy", centerY)
         .attr("r", 0)
         .attr("fill", "#69b3a2")
@@ -89,7 +94,7 @@ d3.json("data/simulation_results_20250410_093155.json").then(function(data) {
         .attr("stroke", "black")
         .attr("stroke-width", 0.2)
         .append("title")
-        .text(d => `Outlier: ${d.toFixed(2)}%`);
+        .text(d => `Outlier: ${d.value.toFixed(2)}% (${d.count} runs)`);
 
     let showing = false;
     d3.select("#toggle-outliers").on("click", function () {
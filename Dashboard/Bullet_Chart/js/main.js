@@ -1,17 +1,11 @@
-d3.json("data/simulation_results_20250410_093155.json").then(function(data) {
-    const totalDays = data.length;
-    const numWorkstations = data[0].occupancy_per_workstation.length;
-
-    const sums = new Array(numWorkstations).fill(0);
-    data.forEach(entry => {
-        entry.occupancy_per_workstation.forEach((value, i) => {
-            sums[i] += value;
-        });
-    });
+// Per-station means and confidence intervals come pre-aggregated from the simulator's summary file (Simulator/summary.py).
+d3.json("data/simulator.summary.json").then(function(summary) {
+    const occupancy = summary.stations.occupancy_per_workstation;
 
-    const occupancyData = sums.map((sum, i) => ({
+    const occupancyData = occupancy.mean.map((mean, i) => ({
         workstation: `Work station ${i}`,
-        measure: sum / totalDays,
+        measure: mean,
+        halfWidth: occupancy.ci_half_width ? occupancy.ci_half_width[i] : 0,
         target: 0.95
     }));
 
@@ -61,7 +55,7 @@ d3.json("data/simulation_results_20250410_093155.json").then(function(data) {
             .attr("y", height / 4)
             .attr("fill", d.measure >= d.target ? "steelblue" : "#e67e22")
             .append("title")
-            .text(`Workstation: ${d.workstation}\nAvg: ${(d.measure * 100).toFixed(2)}%\nTarget: ${(d.target * 100)}%`);
+            .text(`Workstation: ${d.workstation}\nAvg: ${(d.measure * 100).toFixed(2)}% ± ${(d.halfWidth * 100).toFixed(2)}%\nTarget: ${(d.target * 100)}%`);
 
 
         g.append("line")
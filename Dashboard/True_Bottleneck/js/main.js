@@ -1,16 +1,7 @@
-d3.json("data/simulation_results_20250410_093155.json").then(function (simulations) {
-    var n_runs = simulations.length;
+// Per-station means come pre-aggregated from the simulator's summary file (Simulator/summary.py).
+d3.json("data/simulator.summary.json").then(function (summary) {
     var n_workstations = 6;
-    var waiting_sum = Array(n_workstations).fill(0);
-    simulations.forEach(function (run) {
-        var waiting_times = run["bottleneck_workstations"]["waiting_times"];
-        for (var i = 0; i < n_workstations; i++) {
-            waiting_sum[i] += waiting_times[i];
-        }
-    });
-    var avg_waiting = waiting_sum.map(function (total) {
-        return total / n_runs;
-    });
+    var avg_waiting = summary["stations"]["bottleneck_workstations.waiting_times"]["mean"];
     var ws_labels = d3.range(n_workstations).map(function (i) {
         return "WS " + i;
     });
@@ -15,8 +15,17 @@ const tooltip = d3.select(".charts-container")
   .attr("class", "tooltip")
   .style("opacity", 0);
 
+// Results are streamed by the simulator as NDJSON, one replication per line.
+function loadResults(path) {
+  return d3.text(path).then(text =>
+    text.split("\n").filter(line => line.trim()).map(line => JSON.parse(line))
+  );
+}
+
 function main() {
-  d3.json("../Simulator/data/simulator.json")
+  // main.py writes Data/simulator.ndjson when run from Simulator/; data/simulator.json is the bundled sample.
+  loadResults("../Simulator/Data/simulator.ndjson")
+    .catch(() => d3.json("../Simulator/data/simulator.json"))
     .then(data => {
       allData = data;
       setUpPrimaryNav();
@@ -0,0 +1,186 @@
+"""
+The accidents module estimates the accident probability and the production lost to accidents.
+
+An accident is checked once per time unit with probability config.ACCIDENT_PROB and halts the
+run, so a plain replication only tells whether one happened (accident_rate is 0 or 100) and
+estimates need many replications when accidents are rare. Accidents draw from their own
+substream and do not affect the line until they stop it, so each replication here runs the line
+once to the horizon without accidents, keeping the completion time of every accepted product,
+and then places the accident on that path:
+
+    - Crude Monte Carlo: the accident time the replication's own accident stream gives, as in a
+      regular run. Lost production is what the line accepts from the accident to the horizon.
+    - Importance sampling: the accident time is drawn from a geometric distribution with
+      probability q, truncated to the horizon so every replication has an accident, and weighted
+      by the likelihood ratio of the real distribution to that one. With q equal to the accident
+      probability (the default) the weight is the probability of an accident before the horizon,
+      so the probability is exact and only the lost production varies; a larger q puts the
+      accidents earlier, where they cost more production.
+
+The variance reduction factor, i.e. how many times fewer replications importance sampling needs,
+is the ratio of the variance of the crude estimator to that of importance sampling. The crude
+variance is itself estimated by importance sampling (from the weighted second moment), since a
+crude run with rare accidents may not see one and would report no variance at all.
+
+Usage:
+    python accidents.py --replications 200 --accident_prob 0.000001
+"""
+
+import math
+import argparse
+
+import numpy as np
+
+from eventcore import simulate
+from main import replication_seeds
+from results import write_json_atomic
+from stopping import RunningStatistics
+from utils import SimulationConfig, RandomStreams, build_parser, configure_logging
+
+
+def accident_probability(prob, checks):
+    """
+    Returns the probability that at least one of `checks` checks with probability `prob` finds an accident.
+    """
+    return -math.expm1(checks * math.log1p(-prob))
+
+
+def tilted_accident_time(u, prob, checks):
+    """
+    Draws an accident time from a geometric distribution truncated to the first `checks` checks.
+
+    Parameters:
+        u (float): Uniform variate in [0, 1).
+        prob (float): Per-check probability of the geometric distribution.
+        checks (int): Number of accident checks before the horizon.
+
+    Returns:
+        int: The time of the accident, between 1 and checks.
+    """
+    log_survival = math.log1p(-prob)
+    time = math.ceil(math.log1p(-u * accident_probability(prob, checks)) / log_survival)
+    return min(max(time, 1), checks)
+
+
+def likelihood_ratio(time, prob, tilted_prob, checks):
+    """
+    Returns the likelihood ratio of an accident at `time` under the real geometric distribution
+    to the truncated one it was drawn from (see tilted_accident_time()).
+    """
+    if tilted_prob == prob:
+        return accident_probability(prob, checks)
+    log_real = math.log(prob) + (time - 1) * math.log1p(-prob)
+    log_tilted = (math.log(tilted_prob) + (time - 1) * math.log1p(-tilted_prob)
+                  - math.log(accident_probability(tilted_prob, checks)))
+    return math.exp(log_real - log_tilted)
+
+
+def estimate_accidents(config, replications, seed=0, tilted_prob=None):
+    """
+    Estimates the accident probability and the expected production lost to accidents with crude
+    Monte Carlo and importance sampling on the same replications.
+
+    Parameters:
+        config (SimulationConfig): The configuration of the simulation; ACCIDENT_PROB is the probability estimated.
+        replications (int): Number of replications.
+        seed (int): Master seed of the replications.
+        tilted_prob (float): Per-check accident probability the importance sampling draws from.
+                             Defaults to config.ACCIDENT_PROB.
+
+    Returns:
+        dict: The exact accident probability and, for the probability and the lost production, the
+              mean, variance and confidence interval half-width of both estimators, the variance of the
+              crude estimator estimated by importance sampling and the variance reduction factor
+              (None when importance sampling has no variance).
+
+    Raises:
+        ValueError: If a probability is not strictly between 0 and 1, or the horizon allows no accident check.
+    """
+    prob = config.ACCIDENT_PROB
+    tilted_prob = prob if tilted_prob is None else tilted_prob
+    checks = math.ceil(config.SIMULATION_TIME) - 1
+    if not 0 < prob < 1:
+        raise ValueError(f"The accident probability must be between 0 and 1 (exclusive), not {prob}.")
+    if not 0 < tilted_prob < 1:
+        raise ValueError(f"The tilted accident probability must be between 0 and 1 (exclusive), not {tilted_prob}.")
+    if checks < 1:
+        raise ValueError(f"No accident is checked before a simulation time of {config.SIMULATION_TIME}; "
+                         f"it must be greater than 1.")
+    line_config = config._replace(ACCIDENT_PROB=0)
+
+    crude = {"probability": RunningStatistics(), "lost_production": RunningStatistics()}
+    weighted = {"probability": RunningStatistics(), "lost_production": RunningStatistics()}
+    # Second moments of the crude estimators, E[Y ** 2] = E_q[weight * Y ** 2] for an indicator or loss Y.
+    second_moments = {"probability": RunningStatistics(), "lost_production": RunningStatistics()}
+    for replication_seed in replication_seeds(seed, replications):
+        accepted_times = []
+        simulate(line_config, replication_seed, accepted_times)
+
+        streams = RandomStreams(replication_seed, config.RNG_BLOCK_SIZE)
+        accidents = streams.accidents.take(checks) < prob
+        if accidents.any():
+            time = int(np.argmax(accidents)) + 1
+            crude["probability"].add(1.0)
+            crude["lost_production"].add(len(accepted_times) - np.searchsorted(accepted_times, time))
+        else:
+            crude["probability"].add(0.0)
+            crude["lost_production"].add(0.0)
+
+        # The importance sampling draws come from a substream of their own, next to the replication's streams.
+        substream = np.random.SeedSequence(replication_seed).spawn(len(RandomStreams.SOURCES) + 1)[-1]
+        generator = np.random.default_rng(substream)
+        time = tilted_accident_time(generator.random(), tilted_prob, checks)
+        weight = likelihood_ratio(time, prob, tilted_prob, checks)
+        lost = len(accepted_times) - np.searchsorted(accepted_times, time)
+        weighted["probability"].add(weight)
+        weighted["lost_production"].add(weight * lost)
+        second_moments["probability"].add(weight)
+        second_moments["lost_production"].add(weight * lost ** 2)
+
+    report = {"accident_probability": accident_probability(prob, checks), "tilted_prob": tilted_prob,
+              "replications": replications}
+    for name in crude:
+        estimators = {}
+        for method, statistics in (("crude", crude[name]), ("importance_sampling", weighted[name])):
+            estimators[method] = {
+                "mean": float(statistics.mean),
+                "variance": float(statistics.variance),
+                "half_width": float(statistics.half_width(config.CONFIDENCE)),
+            }
+        crude_variance = float(second_moments[name].mean - weighted[name].mean ** 2)
+        variance = estimators["importance_sampling"]["variance"]
+        estimators["crude_variance"] = crude_variance
+        estimators["variance_reduction"] = crude_variance / variance if variance > 0 else None
+        report[name] = estimators
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accident probability and lost production estimation",
+                                     parents=[build_parser(add_help=False)])
+    parser.add_argument("--replications", type=int, default=100, help="Number of replications")
+    parser.add_argument("--tilted_prob", type=float, default=None,
+                        help="Per-check accident probability of the importance sampling (the accident probability by default)")
+    parser.add_argument("--output", default="Data/accidents.json", help="Path of the estimation report")
+    args = parser.parse_args()
+    configure_logging(args.verbosity)
+    config = SimulationConfig.from_args(args)
+
+    try:
+        report = estimate_accidents(config, args.replications, args.seed or 0, args.tilted_prob)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    print(f"Accident probability before the horizon: {report['accident_probability']:.6g}")
+    for name in ("probability", "lost_production"):
+        estimators = report[name]
+        for method in ("crude", "importance_sampling"):
+            estimate = estimators[method]
+            print(f"{name:>16} {method:>20}  {estimate['mean']:>12.6g} +- {estimate['half_width']:<12.4g}")
+        reduction = estimators["variance_reduction"]
+        print(f"{name:>16} {'variance reduction':>20}  {'exact' if reduction is None else f'{reduction:.1f}x'}")
+    write_json_atomic(args.output, report)
+    print(f"Estimates successfully exported to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
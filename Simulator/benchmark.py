@@ -0,0 +1,337 @@
+"""
+The benchmark module measures the throughput of the simulator.
+
+Every benchmark also accepts the simulation flags of main.py (e.g. --seed, --chunk_size).
+
+Usage:
+    python benchmark.py parallel --replications 64 --max_workers 8
+    python benchmark.py admission --horizon 20000 --wip_limits 0 8 16
+    python benchmark.py events --replications 5
+    python benchmark.py suite --save_baseline
+    python benchmark.py suite --threshold 0.15
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import simpy
+
+from main import export_results_to_json, run_simulation, run_multiple_simulations_dict
+from results import write_json_atomic
+from utils import SimulationConfig, build_parser, configure_logging
+from instrumentation import InstrumentedEnvironment, peak_rss_mb
+
+
+def bench_parallel_scaling(config, replications, worker_counts):
+    """
+    Measures how replication throughput scales with the number of worker processes.
+
+    Every worker count runs the same replications with the same master seed, and the
+    results are checked against the serial run to make sure parallelism does not change them.
+
+    Args:
+        config (SimulationConfig): The configuration to run (its WORKERS setting is replaced).
+        replications (int): Number of replications to run for each worker count.
+        worker_counts (list[int]): Worker counts to measure.
+
+    Returns:
+        list[dict]: One row per worker count with the wall time, throughput and speedup.
+    """
+    config = config._replace(SEED=config.SEED or 0)
+    rows = []
+    reference = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        results = run_multiple_simulations_dict(config._replace(WORKERS=workers), replications)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = (elapsed, results)
+        rows.append({
+            "workers": workers,
+            "wall_time": elapsed,
+            "replications_per_sec": replications / elapsed,
+            "speedup": reference[0] / elapsed,
+            "efficiency": reference[0] / elapsed / workers,
+            "identical": results == reference[1],
+        })
+    return rows
+
+
+def _admission_case(config, seed):
+    """
+    Runs one replication of the admission benchmark. Meant to run in a fresh process so
+    that its peak RSS only reflects this case.
+    """
+    env = InstrumentedEnvironment()
+    start = time.perf_counter()
+    result = run_simulation(config, seed, env)
+    elapsed = time.perf_counter() - start
+    return {
+        "wip_limit": config.WIP_LIMIT,
+        "events_per_sec": env.events_processed / elapsed,
+        "peak_live_processes": env.peak_live_processes,
+        "peak_rss_mb": peak_rss_mb(),
+        "accepted_products": result["accepted_products"],
+        "avg_delay_time": result["avg_delay_time"],
+    }
+
+
+def bench_admission(config, horizon, wip_limits):
+    """
+    Compares peak memory and event throughput of a long run with and without a WIP limit.
+
+    Each case runs in its own spawned process so its peak RSS is not inflated by the others.
+    Accidents are disabled so every case runs for the full horizon.
+
+    Args:
+        config (SimulationConfig): The configuration to run.
+        horizon (int): Simulated time of each case.
+        wip_limits (list[int]): WIP limits to compare (0 runs without admission control).
+
+    Returns:
+        list[dict]: One row per WIP limit.
+    """
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for wip_limit in wip_limits:
+        case = config._replace(SIMULATION_TIME=horizon, WIP_LIMIT=wip_limit, ACCIDENT_PROB=0)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            rows.append(pool.submit(_admission_case, case, config.SEED or 0).result())
+    return rows
+
+
+def bench_event_rate(config, replications):
+    """
+    Measures how many SimPy events per second a replication processes.
+
+    The events of each replication are counted in an instrumented run, then the same seed is
+    timed again in a plain environment so the counting does not slow down the measurement.
+    Accidents are disabled so every replication runs for the full horizon.
+
+    Args:
+        config (SimulationConfig): The configuration to run.
+        replications (int): Number of replications to measure.
+
+    Returns:
+        list[dict]: One row per replication.
+    """
+    config = config._replace(ACCIDENT_PROB=0)
+    rows = []
+    for seed in range(replications):
+        env = InstrumentedEnvironment()
+        run_simulation(config, seed, env)
+        start = time.perf_counter()
+        run_simulation(config, seed)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "seed": seed,
+            "events": env.events_processed,
+            "wall_time": elapsed,
+            "events_per_sec": env.events_processed / elapsed,
+        })
+    return rows
+
+
+# Scenarios of the regression suite: parameter overrides (by command-line name) and replications.
+SUITE_SCENARIOS = {
+    "default": ({}, 5),
+    "long_horizon": ({"simulation_time": 100000}, 1),
+    "high_bin_capacity": ({"bin_capacity": 500}, 3),
+    "near_saturation": ({"arrival_interval": 4.2}, 5),
+}
+
+# Results written per export_results_to_json measurement, so its time is not dominated by opening the file.
+EXPORT_RESULTS = 1000
+
+# Suite metrics where a larger value is a slowdown; for the others a smaller value is.
+LOWER_IS_BETTER = ("peak_rss_mb", "export_time")
+
+
+def _suite_case(config, replications):
+    """
+    Runs one scenario of the regression suite. Meant to run in a fresh process so that its
+    peak RSS only reflects this scenario.
+    """
+    seeds = range(replications)
+    start = time.perf_counter()
+    results = [run_simulation(config, seed) for seed in seeds]
+    elapsed = time.perf_counter() - start
+    peak_rss = peak_rss_mb()
+
+    # Count the events of the same seeds in an instrumented run, so the counting does not slow down the timing.
+    events = 0
+    for seed in seeds:
+        env = InstrumentedEnvironment()
+        run_simulation(config, seed, env)
+        events += env.events_processed
+
+    with tempfile.TemporaryDirectory() as folder:
+        exported = (results * (EXPORT_RESULTS // replications + 1))[:EXPORT_RESULTS]
+        start = time.perf_counter()
+        export_results_to_json(exported, generated_folder=folder, backup_folder=folder)
+        export_time = time.perf_counter() - start
+
+    return {
+        "events_per_sec": events / elapsed,
+        "replications_per_sec": replications / elapsed,
+        "peak_rss_mb": peak_rss,
+        "export_time": export_time,
+        "accepted_products": sum(result["accepted_products"] for result in results),
+    }
+
+
+def bench_suite(config, scenarios=SUITE_SCENARIOS):
+    """
+    Runs the fixed-seed regression scenarios, each in its own spawned process.
+
+    Accidents are disabled so every replication runs for the full horizon, and replication i
+    of every scenario uses seed i, so the simulated work is identical from run to run.
+
+    Args:
+        config (SimulationConfig): The configuration the scenario overrides are applied to.
+        scenarios (dict): Scenario name -> (parameter overrides, replications).
+
+    Returns:
+        dict: Scenario name -> events/sec, replications/sec, peak RSS, export time and the total
+              accepted products (to tell a slowdown from a change of behavior).
+    """
+    context = multiprocessing.get_context("spawn")
+    report = {}
+    for name, (parameters, replications) in scenarios.items():
+        case = config.with_parameters(accident_prob=0, **parameters)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            report[name] = pool.submit(_suite_case, case, replications).result()
+        print(f"{name}: {json.dumps(report[name])}")
+    return report
+
+
+def compare_to_baseline(report, baseline, threshold):
+    """
+    Compares a suite report with a baseline report.
+
+    Args:
+        report (dict): Report returned by bench_suite().
+        baseline (dict): Stored report to compare against.
+        threshold (float): Largest accepted slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+        list[dict]: One row per scenario and metric, with the relative slowdown (negative for a
+                    speedup) and whether it exceeds the threshold.
+    """
+    rows = []
+    for scenario, metrics in report.items():
+        if scenario not in baseline:
+            continue
+        for metric, value in metrics.items():
+            reference = baseline[scenario].get(metric)
+            if metric == "accepted_products" or not reference or not value:
+                continue
+            slowdown = value / reference - 1 if metric in LOWER_IS_BETTER else reference / value - 1
+            rows.append({
+                "scenario": scenario,
+                "metric": metric,
+                "baseline": reference,
+                "current": value,
+                "slowdown": slowdown,
+                "regression": slowdown > threshold,
+            })
+        if metrics["accepted_products"] != baseline[scenario].get("accepted_products"):
+            print(f"Note: {scenario} simulated different results than the baseline; the model changed.")
+    return rows
+
+
+def environment_info():
+    """
+    Describes the machine and library versions a suite report was measured with.
+    """
+    return {
+        "python": platform.python_version(),
+        "simpy": simpy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_rows(rows):
+    """
+    Prints benchmark rows as an aligned table.
+
+    Args:
+        rows (list[dict]): Rows returned by one of the benchmark functions.
+    """
+    headers = list(rows[0].keys())
+    print("  ".join(f"{header:>20}" for header in headers))
+    for row in rows:
+        print("  ".join(f"{value:>20.3f}" if isinstance(value, float) else f"{str(value):>20}"
+                        for value in row.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manufacturing Facility Simulation benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    simulation = [build_parser(add_help=False)]
+
+    parallel = subparsers.add_parser("parallel", parents=simulation, help="Replication throughput versus worker count")
+    parallel.add_argument("--replications", type=int, default=32, help="Replications per worker count")
+    parallel.add_argument("--max_workers", type=int, default=os.cpu_count(), help="Largest worker count to measure")
+
+    admission = subparsers.add_parser("admission", parents=simulation,
+                                      help="Peak RSS and events/sec with and without a WIP limit")
+    admission.add_argument("--horizon", type=int, default=20000, help="Simulated time of each case")
+    admission.add_argument("--wip_limits", type=int, nargs="+", default=[0, 8, 16, 32], help="WIP limits to compare")
+
+    events = subparsers.add_parser("events", parents=simulation, help="SimPy events processed per second")
+    events.add_argument("--replications", type=int, default=5, help="Replications to measure")
+
+    suite = subparsers.add_parser("suite", parents=simulation,
+                                  help="Fixed-seed regression scenarios compared against a stored baseline")
+    suite.add_argument("--baseline", default="Data/benchmark_baseline.json", help="Path of the baseline report")
+    suite.add_argument("--save_baseline", action="store_true", help="Store this run as the new baseline")
+    suite.add_argument("--threshold", type=float, default=0.2, help="Largest accepted slowdown (0.2 for 20%%)")
+    suite.add_argument("--scenarios", nargs="+", choices=list(SUITE_SCENARIOS), default=list(SUITE_SCENARIOS),
+                       help="Scenarios to run")
+
+    args = parser.parse_args()
+    configure_logging(args.verbosity)
+    config = SimulationConfig.from_args(args)
+
+    if args.benchmark == "parallel":
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= args.max_workers:
+            worker_counts.append(worker_counts[-1] * 2)
+        if worker_counts[-1] != args.max_workers:
+            worker_counts.append(args.max_workers)
+        print_rows(bench_parallel_scaling(config, args.replications, worker_counts))
+    elif args.benchmark == "admission":
+        print_rows(bench_admission(config, args.horizon, args.wip_limits))
+    elif args.benchmark == "events":
+        print_rows(bench_event_rate(config, args.replications))
+    elif args.benchmark == "suite":
+        report = bench_suite(config, {name: SUITE_SCENARIOS[name] for name in args.scenarios})
+        if args.save_baseline:
+            write_json_atomic(args.baseline, {"environment": environment_info(), "scenarios": report})
+            print(f"Baseline saved to {args.baseline}")
+            return
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; store one with --save_baseline.")
+            return
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["environment"] != environment_info():
+            print(f"Note: the baseline was measured on {json.dumps(baseline['environment'])}")
+        rows = compare_to_baseline(report, baseline["scenarios"], args.threshold)
+        print_rows(rows)
+        regressions = [row for row in rows if row["regression"]]
+        if regressions:
+            print(f"{len(regressions)} metrics slowed down by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
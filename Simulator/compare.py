@@ -0,0 +1,144 @@
+"""
+The compare module compares configurations on common random numbers (CRN).
+
+Every configuration runs the same replication seeds, and every source of randomness has its own
+substream (see utils.RandomStreams), so replication i of each configuration sees the same processing,
+restock, repair, routing, rejection and accident draws. Processing, restock and maintenance draws are
+also kept per station, so the n-th visit of a station gets the same draws even when a change
+reorders the events of the line. The differences between configurations are
+then estimated from the paired differences of each replication, whose variance is
+Var(A) + Var(B) - 2 Cov(A, B) instead of Var(A) + Var(B) for independent runs.
+
+A comparison is described by a JSON spec, as for sweeps; the first configuration is the baseline:
+
+    {"configs": [{"restock_devices_count": 3}, {"restock_devices_count": 4}], "replications": 30}
+
+Usage:
+    python compare.py compare.json --output Data/comparison.json --workers 4
+"""
+
+import json
+import math
+import argparse
+from statistics import NormalDist
+
+import numpy as np
+
+from results import flatten_result, write_json_atomic
+from stopping import RunningStatistics
+from sweep import ResultCache, design_from_spec, run_sweep
+from utils import SimulationConfig, build_parser, configure_logging
+
+
+def run_paired(base_config, configs, replications, seed=0, cache=None, independent=False):
+    """
+    Runs every configuration on the same replication seeds.
+
+    Parameters:
+        base_config (SimulationConfig): Configuration the compared parameters are applied to.
+        configs (list[dict]): The configurations, by command-line parameter name.
+        replications (int): Replications per configuration.
+        seed (int): Master seed of the comparison.
+        cache (ResultCache): Result store. Defaults to Data/cache.
+        independent (bool): Give every configuration its own seeds instead, for reference.
+
+    Returns:
+        list[tuple[dict, list[dict]]]: The full parameters and the results (in replication order) of every configuration.
+    """
+    cache = ResultCache() if cache is None else cache
+    if independent:
+        results = [result for k, point in enumerate(configs)
+                   for *_, result in run_sweep(base_config, [point], replications, seed + k, cache)]
+    else:
+        results = [result for *_, result in run_sweep(base_config, configs, replications, seed, cache)]
+    return [(base_config.with_parameters(**point).parameters(), results[k * replications:(k + 1) * replications])
+            for k, point in enumerate(configs)]
+
+
+def paired_differences(scenarios, metrics, confidence=0.95):
+    """
+    Estimates the difference of every configuration to the baseline from paired replications.
+
+    Besides the confidence interval of the mean difference, every row reports the variance reduction
+    factor of the pairing, Var(A - B) for independent runs over Var(A - B) for the paired ones
+    (the marginal variances are the same either way, so both come from the same runs), and the
+    replications each method needs for the interval to exclude zero.
+
+    Parameters:
+        scenarios (list[tuple[dict, list[dict]]]): Configurations and their results, as returned by
+                                                   run_paired(); the first one is the baseline.
+        metrics (Iterable[str]): Flattened metric names to compare (see results.flatten_result).
+        confidence (float): Confidence level of the intervals.
+
+    Returns:
+        list[dict]: One row per configuration after the baseline, metric (and station for per-station metrics).
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    baseline = [flatten_result(result) for result in scenarios[0][1]]
+    rows = []
+    for k, (parameters, results) in enumerate(scenarios[1:], start=1):
+        changed = {name: value for name, value in parameters.items() if value != scenarios[0][0][name]}
+        flat = [flatten_result(result) for result in results]
+        for metric in metrics:
+            a = np.array([row[metric] for row in baseline], dtype=float).reshape(len(baseline), -1)
+            b = np.array([row[metric] for row in flat], dtype=float).reshape(len(flat), -1)
+            differences = RunningStatistics()
+            for difference in b - a:
+                differences.add(difference)
+            paired = differences.variance
+            independent = a.var(axis=0, ddof=1) + b.var(axis=0, ddof=1)
+            half_width = differences.half_width(confidence)
+            names = [metric] if a.shape[1] == 1 else [f"{metric}[{i + 1}]" for i in range(a.shape[1])]
+            for i, name in enumerate(names):
+                mean = float(differences.mean[i])
+                rows.append({
+                    "scenario": k,
+                    "changed": changed,
+                    "metric": name,
+                    "baseline_mean": float(a[:, i].mean()),
+                    "difference": mean,
+                    "half_width": float(half_width[i]),
+                    "significant": bool(abs(mean) > half_width[i]),
+                    "variance_reduction": float(independent[i] / paired[i]) if paired[i] > 0 else None,
+                    "replications_paired": _replications_needed(paired[i], mean, z),
+                    "replications_independent": _replications_needed(independent[i], mean, z),
+                })
+    return rows
+
+
+def _replications_needed(variance, difference, z):
+    if difference == 0:
+        return None
+    return max(2, math.ceil(z ** 2 * variance / difference ** 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manufacturing Facility Simulation paired comparisons",
+                                     parents=[build_parser(add_help=False)])
+    parser.add_argument("spec", help="Path of the JSON comparison spec (the first configuration is the baseline)")
+    parser.add_argument("--output", default="Data/comparison.json", help="Path of the comparison report")
+    parser.add_argument("--cache", default="Data/cache", help="Folder of the result cache")
+    parser.add_argument("--independent", action="store_true",
+                        help="Run every configuration on its own seeds instead of common random numbers")
+    args = parser.parse_args()
+    configure_logging(args.verbosity)
+    config = SimulationConfig.from_args(args)
+
+    with open(args.spec) as file:
+        spec = json.load(file)
+    scenarios = run_paired(config, design_from_spec(spec), spec.get("replications", 30), spec.get("seed", 0),
+                           ResultCache(args.cache), args.independent)
+    rows = paired_differences(scenarios, config.CI_METRICS, config.CONFIDENCE)
+
+    for row in rows:
+        reduction = f"{row['variance_reduction']:>8.1f}x" if row["variance_reduction"] is not None else "       -"
+        print(f"{row['scenario']:>2} {row['metric']:>28}  {row['difference']:>+12.4f} +- {row['half_width']:<10.4f}"
+              f"{'*' if row['significant'] else ' '}  variance reduction {reduction}  replications "
+              f"{row['replications_paired'] or '-'} paired / {row['replications_independent'] or '-'} independent")
+    write_json_atomic(args.output, {"confidence": config.CONFIDENCE, "independent": args.independent,
+                                    "configs": [parameters for parameters, _ in scenarios], "differences": rows})
+    print(f"Comparison successfully exported to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
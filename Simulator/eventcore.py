@@ -0,0 +1,351 @@
+"""
+The eventcore module is a hand-rolled discrete-event engine for the 6-station line.
+
+It simulates the same model as the SimPy engine (FIFO stations, bins restocked by a pool of
+restock devices, maintenance checks, WIP admission control and accidents) with the same random
+streams and metrics, but without a generator and a handful of event objects per product and
+station visit. Events are plain tuples in one heap, and the state of stations, bins and products
+lives in lists indexed by station or product id. Simultaneous events are handled in the order
+SimPy handles them, so a seed gives the same replication on both engines.
+
+Like the SimPy engine, it stops at the first accident (after the events already scheduled for that
+time) or just before config.SIMULATION_TIME, and work in progress at that moment (services,
+restocks, maintenance) is not counted.
+
+Usage:
+    python eventcore.py --validate_replications 100 --benchmark_replications 5
+"""
+
+import math
+import time
+import argparse
+from heapq import heapify, heappop, heappush
+from collections import deque
+
+from utils import SimulationConfig, RandomStreams, build_parser, configure_logging, collect_metrics
+from fastpath import validate_against_simpy
+
+# Event kinds. Events are (time, sequence, kind, station) tuples; the sequence number keeps
+# simultaneous events in the order they were scheduled.
+ARRIVAL = 0
+SERVICE_DONE = 1
+MAINTENANCE_DONE = 2
+RESTOCK_DONE = 3
+ACCIDENT_CHECK = 4
+
+
+class EngineTotals:
+    """
+    Counters of one replication, named like the ManufacturingFacility attributes read by collect_metrics().
+    """
+    __slots__ = ("station_counts", "accepted_products", "rejected_products", "station_busy_time",
+                 "maintenance_downtime", "restock_device_busy_time", "total_maintenance_time",
+                 "total_maintenance_events", "station_waiting_time", "bin_waiting_time", "balked_products",
+                 "events_processed")
+
+    def __init__(self, num_stations):
+        self.station_counts = [0] * num_stations
+        self.accepted_products = 0
+        self.rejected_products = 0
+        self.station_busy_time = [0.0] * num_stations
+        self.maintenance_downtime = [0.0] * num_stations
+        self.restock_device_busy_time = 0.0
+        self.total_maintenance_time = 0.0
+        self.total_maintenance_events = 0
+        self.station_waiting_time = [0.0] * num_stations
+        self.bin_waiting_time = [0.0] * num_stations
+        self.balked_products = 0
+        self.events_processed = 0
+
+
+def simulate(config, seed=None, accepted_times=None):
+    """
+    Runs one replication with the event engine.
+
+    Parameters:
+        config (SimulationConfig): The configuration of the simulation.
+        seed (int): Seed of the replication's random streams. Fresh entropy is used when None.
+        accepted_times (list[float]): When given, the completion time of every accepted product is appended to it.
+
+    Returns:
+        tuple[EngineTotals, float, bool]: The counters, the time the run ended and whether an accident halted it.
+    """
+    streams = RandomStreams(seed, config.RNG_BLOCK_SIZE, config.NUM_STATIONS)
+    processing_time = streams.processing_time
+    restock_time = streams.restock_time
+    station_fails = streams.station_fails
+    maintenance_time = streams.maintenance_time
+    station_4_first = streams.station_4_first
+    product_rejected = streams.product_rejected
+
+    n = config.NUM_STATIONS
+    capacity = config.BIN_CAPACITY
+    processing_mean = config.PROCESSING_TIME
+    restock_mean = config.RESTOCK_TIME
+    maintenance_mean = config.MAINTENANCE_TIME
+    maintenance_interval = config.MAINTENANCE_INTERVAL
+    failure_probs = config.STATION_FAILURE_PROBS
+    rejection_prob = config.REJECTION_PROB
+    interval = config.ARRIVAL_INTERVAL
+    horizon = config.SIMULATION_TIME
+    balk = config.ADMISSION == "balk"
+
+    totals = EngineTotals(n)
+    station_counts = totals.station_counts
+    station_busy_time = totals.station_busy_time
+    station_waiting_time = totals.station_waiting_time
+    bin_waiting_time = totals.bin_waiting_time
+    maintenance_downtime = totals.maintenance_downtime
+
+    # Station and bin state. holder is the product being served (-1 when idle); a product that
+    # found its bin empty waits in it with bin_wait_start set until the restock arrives.
+    holder = [-1] * n
+    queues = [deque() for _ in range(n)]
+    service_start = [0.0] * n
+    maintenance_start = [0.0] * n
+    levels = [capacity] * n
+    bin_wait_start = [None] * n
+    restock_start = [0.0] * n
+    restock_queue = deque()
+    free_devices = config.RESTOCK_DEVICES
+
+    # Product state: the route and the index of the current station, by product id.
+    routes = []
+    steps = []
+    tokens = config.WIP_LIMIT if config.WIP_LIMIT > 0 else None
+    generator_blocked = False
+
+    heap = []
+    sequence = 0
+
+    def schedule(at, kind, station=-1):
+        nonlocal sequence
+        sequence += 1
+        heappush(heap, (at, sequence, kind, station))
+
+    def start_restock(station, now):
+        nonlocal free_devices
+        if free_devices:
+            free_devices -= 1
+            restock_start[station] = now
+            schedule(now + restock_time(station, restock_mean), RESTOCK_DONE, station)
+        else:
+            restock_queue.append(station)
+
+    def take_material(station, now):
+        levels[station] -= 1
+        if levels[station] == 0:
+            start_restock(station, now)
+        schedule(now + processing_time(station, processing_mean), SERVICE_DONE, station)
+
+    def grant(station, product, requested_at, now):
+        holder[station] = product
+        station_waiting_time[station] += now - requested_at
+        service_start[station] = now
+        if levels[station]:
+            take_material(station, now)
+        else:
+            bin_wait_start[station] = now
+
+    def request(station, product, now):
+        if holder[station] < 0 and not queues[station]:
+            grant(station, product, now, now)
+        else:
+            queues[station].append((product, now))
+
+    def release_product(now):
+        product = len(routes)
+        routes.append((0, 1, 2, 3, 4, 5) if station_4_first() else (0, 1, 2, 4, 3, 5))
+        steps.append(0)
+        request(0, product, now)
+
+    def finish_service(station, now):
+        nonlocal tokens, generator_blocked
+        product = holder[station]
+        station_busy_time[station] += now - service_start[station]
+        holder[station] = -1
+        queue = queues[station]
+        if queue:
+            waiting, requested_at = queue.popleft()
+            grant(station, waiting, requested_at, now)
+
+        step = steps[product] + 1
+        route = routes[product]
+        if step < len(route):
+            steps[product] = step
+            request(route[step], product, now)
+            return
+        if product_rejected(rejection_prob):
+            totals.rejected_products += 1
+        else:
+            totals.accepted_products += 1
+            if accepted_times is not None:
+                accepted_times.append(now)
+        if tokens is not None:
+            if generator_blocked:
+                # The generator was waiting for this token: release the next product right away.
+                generator_blocked = False
+                release_product(now)
+                schedule(now + interval, ARRIVAL)
+            else:
+                tokens += 1
+
+    schedule(0, ARRIVAL)
+    if config.ACCIDENT_PROB > 0:
+        schedule(1, ACCIDENT_CHECK)
+
+    accident = False
+    end_time = horizon
+    events = 0
+    # Sequence number of the last event processed after an accident (see ACCIDENT_CHECK below).
+    last_event = math.inf
+    while heap:
+        now, order, kind, station = heappop(heap)
+        if now >= horizon or order > last_event:
+            break
+        events += 1
+        if kind == SERVICE_DONE:
+            station_counts[station] += 1
+            if station_counts[station] % maintenance_interval == 0 and station_fails(station, failure_probs[station]):
+                maintenance_start[station] = now
+                schedule(now + maintenance_time(station, maintenance_mean), MAINTENANCE_DONE, station)
+            else:
+                finish_service(station, now)
+        elif kind == ARRIVAL:
+            if tokens is None:
+                release_product(now)
+            elif tokens > 0:
+                tokens -= 1
+                release_product(now)
+            elif balk:
+                totals.balked_products += 1
+            else:
+                generator_blocked = True
+                continue
+            schedule(now + interval, ARRIVAL)
+        elif kind == RESTOCK_DONE:
+            totals.restock_device_busy_time += now - restock_start[station]
+            levels[station] += capacity
+            if restock_queue:
+                queued = restock_queue.popleft()
+                restock_start[queued] = now
+                schedule(now + restock_time(queued, restock_mean), RESTOCK_DONE, queued)
+            else:
+                free_devices += 1
+            if bin_wait_start[station] is not None:
+                bin_waiting_time[station] += now - bin_wait_start[station]
+                bin_wait_start[station] = None
+                take_material(station, now)
+        elif kind == MAINTENANCE_DONE:
+            duration = now - maintenance_start[station]
+            maintenance_downtime[station] += duration
+            totals.total_maintenance_time += duration
+            totals.total_maintenance_events += 1
+            finish_service(station, now)
+        elif kind == ACCIDENT_CHECK:
+            if streams.accident_happens(config.ACCIDENT_PROB):
+                # SimPy halts once the events already scheduled for the accident time (e.g. an arrival,
+                # which may balk) have been processed, so those still run, and nothing scheduled after.
+                accident = True
+                end_time = now
+                last_event = sequence
+                heap = [event for event in heap if event[0] == now]
+                heapify(heap)
+                continue
+            schedule(now + 1, ACCIDENT_CHECK)
+
+    totals.events_processed = events
+    return totals, end_time, accident
+
+
+def run_event_simulations(config, seeds):
+    """
+    Runs a batch of replications with the event engine.
+
+    Parameters:
+        config (SimulationConfig): The configuration of the simulation.
+        seeds (list[int]): Seed of each replication.
+
+    Returns:
+        list[dict]: One dictionary per replication, with the keys defined in run_simulation().
+    """
+    if config.TRACE_DIR is not None:
+        raise ValueError("The event engine does not write event traces; use --engine simpy.")
+    if config.SAMPLE_INTERVAL > 0:
+        raise ValueError("The event engine does not sample KPI series; use --engine simpy.")
+    if config.FROM_SNAPSHOT is not None:
+        raise ValueError("The event engine cannot start from a snapshot; use --engine simpy.")
+    if config.INSTRUMENT or config.PROFILE_DIR is not None:
+        raise ValueError("The event engine is not instrumented; use --engine simpy.")
+    results = []
+    for seed in seeds:
+        totals, end_time, accident = simulate(config, seed)
+        if accident:
+            print("Accident happened")
+        results.append(collect_metrics(config, totals, end_time, accident))
+    return results
+
+
+def benchmark_engines(config, replications):
+    """
+    Compares the event rate of the SimPy and event engines on the same seeds.
+
+    Both engines process comparable events (a service completion, restock, arrival, ...), but
+    SimPy also schedules an event for every request, container get and process start, so its
+    count is higher for the same simulated work. Replications per second compares the engines directly.
+
+    Parameters:
+        config (SimulationConfig): The configuration to run. Accidents are disabled.
+        replications (int): Replications per engine.
+
+    Returns:
+        list[dict]: One row per engine.
+    """
+    from main import run_simulation
+    from instrumentation import InstrumentedEnvironment
+
+    config = config._replace(ACCIDENT_PROB=0)
+    seeds = range(replications)
+
+    simpy_events = 0
+    for seed in seeds:
+        env = InstrumentedEnvironment()
+        run_simulation(config, seed, env)
+        simpy_events += env.events_processed
+    start = time.perf_counter()
+    for seed in seeds:
+        run_simulation(config, seed)
+    simpy_time = time.perf_counter() - start
+
+    engine_events = 0
+    start = time.perf_counter()
+    for seed in seeds:
+        engine_events += simulate(config, seed)[0].events_processed
+    engine_time = time.perf_counter() - start
+
+    return [
+        {"engine": "simpy", "events": simpy_events, "events_per_sec": simpy_events / simpy_time,
+         "replications_per_sec": replications / simpy_time},
+        {"engine": "event", "events": engine_events, "events_per_sec": engine_events / engine_time,
+         "replications_per_sec": replications / engine_time},
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event engine validation and benchmark",
+                                     parents=[build_parser(add_help=False)])
+    parser.add_argument("--validate_replications", type=int, default=30, help="Replications per engine")
+    parser.add_argument("--benchmark_replications", type=int, default=5, help="Replications timed per engine")
+    args = parser.parse_args()
+    configure_logging(args.verbosity)
+    config = SimulationConfig.from_args(args)
+
+    for row in validate_against_simpy(config, args.validate_replications, args.seed or 0, run_event_simulations):
+        print(f"{row['metric']:>28}  simpy {row['simpy_mean']:>12.4f}  event {row['engine_mean']:>12.4f}  "
+              f"t {row['t']:>7.2f}  {'ok' if row['ok'] else 'DIFFERS'}")
+    for row in benchmark_engines(config, args.benchmark_replications):
+        print(f"{row['engine']:>6}  {row['events']:>10} events  {row['events_per_sec']:>12.0f} events/sec  "
+              f"{row['replications_per_sec']:>8.2f} replications/sec")
+
+if __name__ == "__main__":
+    main()
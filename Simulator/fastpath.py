@@ -0,0 +1,342 @@
+"""
+The fastpath module is a vectorized engine for the 6-station line, for large parameter sweeps.
+
+Instead of running SimPy processes, it computes every station with the tandem-queue recursion
+of a single-server FIFO station over arrays of jobs:
+
+    start = max(arrival, previous departure)
+    departure = max(start, bin restocked) + processing + maintenance
+
+vectorized over a batch of replications (one row per replication). The n-th job served by a
+station always gets the n-th processing time, the n-th maintenance check (every
+MAINTENANCE_INTERVAL jobs, failing with STATION_FAILURE_PROBS) and, every BIN_CAPACITY jobs,
+the next restock. Stations 4 and 5 feed each other (products visit them in a random order),
+so they are iterated to a fixed point.
+
+Differences from the SimPy engine: restock devices are assumed to be always available, WIP
+limits are not modelled, and an accident is drawn directly as the geometric time of the first
+failed check. Configurations whose restock devices would be busy more than MAX_RESTOCK_LOAD of
+the time, where waiting for a device matters, are rejected.
+
+Usage:
+    python fastpath.py --validate_replications 50
+"""
+
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+from utils import SimulationConfig, RandomStreams, build_parser, configure_logging, collect_metrics
+
+# Fixed-point iterations allowed for the coupled stations 4 and 5 before giving up.
+MAX_COUPLING_ITERATIONS = 100
+# Largest expected utilization of the restock devices for which they are assumed to be always available.
+MAX_RESTOCK_LOAD = 0.1
+
+
+def restock_load(config):
+    """
+    Returns the expected utilization of the restock devices: every station empties a bin every
+    BIN_CAPACITY processing times, and a restock holds one of RESTOCK_DEVICES devices for RESTOCK_TIME.
+    """
+    return (config.NUM_STATIONS * config.RESTOCK_TIME
+            / (config.BIN_CAPACITY * config.PROCESSING_TIME * config.RESTOCK_DEVICES))
+
+
+def _draw_batch(config, seeds, num_products):
+    """
+    Draws the variates of a batch of replications from their random streams.
+
+    Parameters:
+        config (SimulationConfig): The configuration of the simulation.
+        seeds (list[int]): Seed of each replication.
+        num_products (int): Products released per replication (and at most jobs per station).
+
+    Returns:
+        SimpleNamespace: Arrays with one row per replication.
+    """
+    stations = config.NUM_STATIONS
+    checks = num_products // config.MAINTENANCE_INTERVAL
+    restocks = num_products // config.BIN_CAPACITY + 1
+    failure_probs = np.array(config.STATION_FAILURE_PROBS)[:, None]
+
+    processing, repairs, restock, routes, rejected, accidents = [], [], [], [], [], []
+    for seed in seeds:
+        streams = RandomStreams(seed, config.RNG_BLOCK_SIZE, stations)
+        processing.append(np.maximum(0, config.PROCESSING_TIME + 0.5 * np.stack(
+            [stream.take(num_products) for stream in streams.processing])))
+        fails = np.stack([stream.take(checks) for stream in streams.failure]) < failure_probs
+        repair = config.MAINTENANCE_TIME * np.stack([stream.take(checks) for stream in streams.repair])
+        repairs.append(np.where(fails, repair, 0.0))
+        restock.append(np.maximum(0, config.RESTOCK_TIME + 0.5 * np.stack(
+            [stream.take(restocks) for stream in streams.restock])))
+        routes.append(streams.routing.take(num_products) < 0.5)
+        rejected.append(streams.rejection.take(num_products) < config.REJECTION_PROB)
+        accidents.append(streams.accidents.take(1)[0])
+
+    return SimpleNamespace(
+        processing=np.stack(processing),
+        repairs=np.stack(repairs),
+        restock=np.stack(restock),
+        station_4_first=np.stack(routes),
+        rejected=np.stack(rejected),
+        accident_uniforms=np.array(accidents),
+    )
+
+
+def _accident_times(prob, uniforms, horizon):
+    """
+    Converts one uniform per replication into the time of the first accident.
+
+    Accidents are checked once per time unit, so the first one happens after a geometric
+    number of checks. Only checks before the horizon can halt the run.
+
+    Parameters:
+        prob (float): Probability of an accident per time unit.
+        uniforms (numpy.ndarray): One uniform variate per replication.
+        horizon (int): The simulation time.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The end time of each replication and whether it had an accident.
+    """
+    if prob <= 0:
+        return np.full(len(uniforms), float(horizon)), np.zeros(len(uniforms), dtype=bool)
+    checks = np.ceil(np.log1p(-uniforms) / np.log1p(-prob)) if prob < 1 else np.ones(len(uniforms))
+    accident = checks < horizon
+    return np.where(accident, checks, float(horizon)), accident
+
+
+def _serve_station(config, station_id, arrivals, draws, end_time, totals):
+    """
+    Runs every job of one station through the FIFO recursion and accumulates its counters.
+
+    Counters only include what happened before the end of each replication, as in the SimPy engine.
+
+    Parameters:
+        config (SimulationConfig): The configuration of the simulation.
+        station_id (int): The index of the station.
+        arrivals (numpy.ndarray): (replications, products) arrival times, np.inf for products that never arrive.
+        draws (SimpleNamespace): The variates returned by _draw_batch().
+        end_time (numpy.ndarray): The end time of each replication.
+        totals (SimpleNamespace): The per-replication counters to update, or None to only compute departures.
+
+    Returns:
+        numpy.ndarray: (replications, products) departure times, in product order.
+    """
+    replications, num_products = arrivals.shape
+    capacity = config.BIN_CAPACITY
+    interval = config.MAINTENANCE_INTERVAL
+    processing = draws.processing[:, station_id]
+    repairs = draws.repairs[:, station_id]
+    restock = draws.restock[:, station_id]
+
+    order = np.argsort(arrivals, axis=1, kind="stable")
+    arrivals_sorted = np.take_along_axis(arrivals, order, axis=1)
+    departures_sorted = np.full((replications, num_products), np.inf)
+    previous = np.zeros(replications)
+    restocked = np.zeros(replications)
+
+    if totals is not None:
+        waiting = np.zeros(replications)
+        bin_waiting = np.zeros(replications)
+        busy = np.zeros(replications)
+        counts = np.zeros(replications)
+        downtime = np.zeros(replications)
+        maintenance_events = np.zeros(replications)
+        restock_busy = np.zeros(replications)
+
+    for n in range(num_products):
+        arrival = arrivals_sorted[:, n]
+        # Jobs are sorted by arrival, so once every replication has ended nothing else is served.
+        if not (arrival < end_time).any():
+            break
+        start = np.maximum(arrival, previous)
+        material = np.maximum(start, restocked)
+        processed = material + processing[:, n]
+        departure = processed
+        count = n + 1
+        if count % interval == 0:
+            repair = repairs[:, count // interval - 1]
+            departure = processed + repair
+        if count % capacity == 0:
+            restock_time = restock[:, count // capacity - 1]
+            restocked = material + restock_time
+        departures_sorted[:, n] = departure
+        previous = departure
+
+        if totals is not None:
+            started = start < end_time
+            waiting += np.where(started, start - arrival, 0)
+            bin_waiting += np.where(material < end_time, material - start, 0)
+            counts += processed < end_time
+            busy += np.where(departure < end_time, departure - start, 0)
+            if count % interval == 0:
+                repaired = (repair > 0) & (departure < end_time)
+                downtime += np.where(repaired, repair, 0)
+                maintenance_events += repaired
+            if count % capacity == 0:
+                restock_busy += np.where(restocked < end_time, restock_time, 0)
+
+    if totals is not None:
+        totals.station_waiting_time[:, station_id] = waiting
+        totals.bin_waiting_time[:, station_id] = bin_waiting
+        totals.station_busy_time[:, station_id] = busy
+        totals.station_counts[:, station_id] = counts
+        totals.maintenance_downtime[:, station_id] = downtime
+        totals.total_maintenance_events += maintenance_events
+        totals.restock_device_busy_time += restock_busy
+
+    departures = np.empty_like(departures_sorted)
+    np.put_along_axis(departures, order, departures_sorted, axis=1)
+    return departures
+
+
+def run_fast_simulations(config, seeds):
+    """
+    Runs a batch of replications with the vectorized engine.
+
+    Parameters:
+        config (SimulationConfig): The configuration of the simulation.
+        seeds (list[int]): Seed of each replication.
+
+    Returns:
+        list[dict]: One dictionary per replication, with the keys defined in run_simulation().
+    """
+    if config.TRACE_DIR is not None:
+        raise ValueError("The fast engine does not write event traces; use --engine simpy.")
+    if config.WIP_LIMIT > 0:
+        raise ValueError("The fast engine does not model WIP limits; use --engine simpy.")
+    if config.SAMPLE_INTERVAL > 0:
+        raise ValueError("The fast engine does not sample KPI series; use --engine simpy.")
+    if config.FROM_SNAPSHOT is not None:
+        raise ValueError("The fast engine cannot start from a snapshot; use --engine simpy.")
+    if config.INSTRUMENT or config.PROFILE_DIR is not None:
+        raise ValueError("The fast engine is not instrumented; use --engine simpy.")
+    if restock_load(config) > MAX_RESTOCK_LOAD:
+        raise ValueError(f"The fast engine assumes idle restock devices, but they would be busy "
+                         f"{restock_load(config):.0%} of the time; use --engine event or simpy.")
+
+    horizon = config.SIMULATION_TIME
+    num_products = int(np.ceil(horizon / config.ARRIVAL_INTERVAL))
+    replications = len(seeds)
+    draws = _draw_batch(config, seeds, num_products)
+    end_time, accident = _accident_times(config.ACCIDENT_PROB, draws.accident_uniforms, horizon)
+
+    stations = config.NUM_STATIONS
+    totals = SimpleNamespace(
+        station_waiting_time=np.zeros((replications, stations)),
+        bin_waiting_time=np.zeros((replications, stations)),
+        station_busy_time=np.zeros((replications, stations)),
+        station_counts=np.zeros((replications, stations)),
+        maintenance_downtime=np.zeros((replications, stations)),
+        total_maintenance_events=np.zeros(replications),
+        restock_device_busy_time=np.zeros(replications),
+    )
+
+    with np.errstate(invalid="ignore"):
+        releases = np.arange(num_products) * config.ARRIVAL_INTERVAL
+        departures = np.where(releases < end_time[:, None], releases, np.inf)
+        for station_id in range(3):
+            departures = _serve_station(config, station_id, departures, draws, end_time, totals)
+
+        # Stations 4 and 5 feed each other: start from the earliest possible arrivals and
+        # iterate the (monotone) recursion until the departures stop changing.
+        station_4_first = draws.station_4_first
+        departures_4 = departures_5 = departures
+        for _ in range(MAX_COUPLING_ITERATIONS):
+            arrivals_4 = np.where(station_4_first, departures, departures_5)
+            new_departures_4 = _serve_station(config, 3, arrivals_4, draws, end_time, None)
+            arrivals_5 = np.where(station_4_first, new_departures_4, departures)
+            new_departures_5 = _serve_station(config, 4, arrivals_5, draws, end_time, None)
+            converged = np.array_equal(new_departures_4, departures_4) and np.array_equal(new_departures_5, departures_5)
+            departures_4, departures_5 = new_departures_4, new_departures_5
+            if converged:
+                break
+        else:
+            raise RuntimeError("Stations 4 and 5 did not converge; try a smaller batch or the SimPy engine.")
+        _serve_station(config, 3, np.where(station_4_first, departures, departures_5), draws, end_time, totals)
+        _serve_station(config, 4, np.where(station_4_first, departures_4, departures), draws, end_time, totals)
+
+        finished = _serve_station(config, 5, np.maximum(departures_4, departures_5), draws, end_time, totals) < end_time[:, None]
+
+    rejected = (finished & draws.rejected).sum(axis=1)
+    accepted = finished.sum(axis=1) - rejected
+    # SimPy draws an exponential repair time, so maintenance time equals its downtime here.
+    total_maintenance_time = totals.maintenance_downtime.sum(axis=1)
+
+    results = []
+    for i in range(replications):
+        facility = SimpleNamespace(
+            accepted_products=int(accepted[i]),
+            rejected_products=int(rejected[i]),
+            balked_products=0,
+            station_waiting_time=totals.station_waiting_time[i].tolist(),
+            bin_waiting_time=totals.bin_waiting_time[i].tolist(),
+            station_busy_time=totals.station_busy_time[i].tolist(),
+            station_counts=totals.station_counts[i].astype(int).tolist(),
+            maintenance_downtime=totals.maintenance_downtime[i].tolist(),
+            restock_device_busy_time=float(totals.restock_device_busy_time[i]),
+            total_maintenance_time=float(total_maintenance_time[i]),
+            total_maintenance_events=int(totals.total_maintenance_events[i]),
+        )
+        results.append(collect_metrics(config, facility, float(end_time[i]), bool(accident[i])))
+    return results
+
+
+VALIDATION_METRICS = ["accepted_products", "rejected_products", "avg_delay_time", "supplier_occupancy",
+                      "avg_fix_time", "occupancy_per_workstation", "avg_production_time"]
+
+
+def validate_against_simpy(config, replications, seed=0, engine=None):
+    """
+    Compares the means of the main metrics of the SimPy engine and another engine over independent replications.
+
+    Each metric gets Welch's t statistic for the difference of the means; |t| above 3 flags a
+    difference that is unlikely to be noise.
+
+    Parameters:
+        config (SimulationConfig): The configuration both engines run.
+        replications (int): Replications per engine.
+        seed (int): Master seed of the comparison.
+        engine (Callable): Runs a batch of replications given the config and seeds, like
+                           run_fast_simulations() (the default).
+
+    Returns:
+        list[dict]: One row per metric (and per station for per-station metrics).
+    """
+    from main import replication_seeds, run_simulation
+
+    seeds = replication_seeds(seed, 2 * replications)
+    simpy_results = [run_simulation(config, s) for s in seeds[:replications]]
+    engine = engine or run_fast_simulations
+    fast_results = engine(config, seeds[replications:])
+
+    rows = []
+    for key in VALIDATION_METRICS:
+        simpy_values = np.array([r[key] for r in simpy_results], dtype=float)
+        fast_values = np.array([r[key] for r in fast_results], dtype=float)
+        names = [key] if simpy_values.ndim == 1 else [f"{key}[{i + 1}]" for i in range(simpy_values.shape[1])]
+        simpy_values = simpy_values.reshape(replications, -1)
+        fast_values = fast_values.reshape(replications, -1)
+        for i, name in enumerate(names):
+            a, b = simpy_values[:, i], fast_values[:, i]
+            std_error = np.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+            t = (b.mean() - a.mean()) / std_error if std_error > 0 else 0.0
+            rows.append({"metric": name, "simpy_mean": a.mean(), "engine_mean": b.mean(), "t": t, "ok": abs(t) < 3})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized engine validation", parents=[build_parser(add_help=False)])
+    parser.add_argument("--validate_replications", type=int, default=30, help="Replications per engine")
+    args = parser.parse_args()
+    configure_logging(args.verbosity)
+    config = SimulationConfig.from_args(args)
+
+    for row in validate_against_simpy(config, args.validate_replications, args.seed or 0):
+        print(f"{row['metric']:>28}  simpy {row['simpy_mean']:>12.4f}  fast {row['engine_mean']:>12.4f}  "
+              f"t {row['t']:>7.2f}  {'ok' if row['ok'] else 'DIFFERS'}")
+
+if __name__ == "__main__":
+    main()
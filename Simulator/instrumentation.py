@@ -0,0 +1,133 @@
+"""
+The instrumentation module measures where the SimPy engine spends its events.
+
+An InstrumentedEnvironment counts every event it processes by event type and by the kind of
+process it resumes (process_station, restock_bin, ...), tracks the processes alive at once and
+the longest queue seen at each watched resource. It is opt-in (--instrument): the counting
+happens on every event and slows the run down.
+"""
+
+import resource
+from collections import Counter
+
+import simpy
+from simpy.events import Process
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the current process, in megabytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class InstrumentedEnvironment(simpy.Environment):
+    """
+    SimPy environment that counts the events it processes, the processes alive at once and
+    the queue lengths of watched resources.
+    """
+    def __init__(self, initial_time=0):
+        super().__init__(initial_time)
+        self.events_processed = 0
+        self.event_types = Counter()
+        self.process_events = Counter()
+        self.live_processes = 0
+        self.peak_live_processes = 0
+        self.peak_queue_lengths = []
+
+    def step(self):
+        if self._queue:
+            event = self._queue[0][3]
+            self.event_types[type(event).__name__] += 1
+            for callback in event.callbacks:
+                owner = getattr(callback, "__self__", None)
+                if isinstance(owner, Process):
+                    self.process_events[owner.name] += 1
+        self.events_processed += 1
+        super().step()
+
+    def process(self, generator):
+        process = super().process(generator)
+        self.live_processes += 1
+        self.peak_live_processes = max(self.peak_live_processes, self.live_processes)
+        process.callbacks.append(self._process_finished)
+        return process
+
+    def _process_finished(self, event):
+        self.live_processes -= 1
+
+    def watch_queues(self, resources):
+        """
+        Tracks the longest queue of each resource (e.g. facility.stations).
+
+        The request method of every resource is wrapped so its queue is measured whenever a
+        request joins it, instead of checking every queue on every event.
+
+        Parameters:
+            resources (list[simpy.Resource]): The resources to watch.
+        """
+        self.peak_queue_lengths = [0] * len(resources)
+        for index, watched in enumerate(resources):
+            watched.request = self._measured_request(watched, index)
+
+    def _measured_request(self, watched, index):
+        request = watched.request
+        peaks = self.peak_queue_lengths
+
+        def measured_request():
+            event = request()
+            if len(watched.queue) > peaks[index]:
+                peaks[index] = len(watched.queue)
+            return event
+        return measured_request
+
+    def report(self, wall_time):
+        """
+        Summarizes the counters of a run.
+
+        Parameters:
+            wall_time (float): Wall-clock seconds the run took.
+
+        Returns:
+            dict: Events processed (in total, per second, per event type and per process type),
+                  peak live processes, peak queue length per watched resource, the wall time and
+                  the peak RSS of the process so far.
+        """
+        return {
+            "events": self.events_processed,
+            "events_per_sec": self.events_processed / wall_time if wall_time > 0 else 0,
+            "event_types": dict(self.event_types.most_common()),
+            "process_events": dict(self.process_events.most_common()),
+            "peak_live_processes": self.peak_live_processes,
+            "peak_queue_length": self.peak_queue_lengths,
+            "wall_time": wall_time,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def summarize_reports(reports):
+    """
+    Aggregates the instrumentation reports of several replications.
+
+    Parameters:
+        reports (list[dict]): Reports returned by InstrumentedEnvironment.report().
+
+    Returns:
+        dict: Totals of the event counts and wall time, the overall events per second, and the
+              largest peaks across replications.
+    """
+    events = sum(report["events"] for report in reports)
+    wall_time = sum(report["wall_time"] for report in reports)
+    process_events = Counter()
+    for report in reports:
+        process_events.update(report["process_events"])
+    return {
+        "replications": len(reports),
+        "events": events,
+        "events_per_sec": events / wall_time if wall_time > 0 else 0,
+        "wall_time": wall_time,
+        "process_events": dict(process_events.most_common()),
+        "peak_live_processes": max(report["peak_live_processes"] for report in reports),
+        "peak_queue_length": [max(peaks) for peaks in zip(*(report["peak_queue_length"] for report in reports))],
+        "peak_rss_mb": max(report["peak_rss_mb"] for report in reports),
+    }
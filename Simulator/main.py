@@ -1,15 +1,37 @@
 import os
 import json
-import datetime
+import time
+import cProfile
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 import simpy
 from utils import *
+from fastpath import run_fast_simulations
+from eventcore import run_event_simulations
+from results import (ResultsWriter, backup_existing, export_columns, iter_results, load_results, load_snapshot,
+                     read_manifest, save_snapshot)
+from stopping import SequentialStopping, run_until_converged
+from monitor import KPIMonitor
+from instrumentation import InstrumentedEnvironment, summarize_reports
+from summary import ResultsSummary, load_summary, summary_path
 
-def run_simulation():
+# Where main() streams its results (the ResultsWriter defaults).
+RESULTS_PATH = os.path.join("Data", "simulator.ndjson")
+
+def run_simulation(config, seed=None, env=None, snapshot=None):
     """
     Runs and logs the results of a single simulation of a manufacturing facility.
 
+    Args:
+        config (SimulationConfig): The configuration of the simulation.
+        seed (int): Seed of the facility's random streams. Fresh entropy is used when None.
+        env (simpy.Environment): Environment to run in (e.g. an instrumented one). A new one is created when None.
+        snapshot (dict): Facility state to continue from (see ManufacturingFacility.snapshot()); the run then
+                         starts at the snapshot's time instead of an empty line at time 0.
+
     Returns:
         dict: A dictionary containing simulation metrics (each value is wrapped in a list or a list of lists)
               including the additional metrics:
@@ -21,114 +43,231 @@ def run_simulation():
                 - "accident_rate" (list[float])
                 - "workstation_status" (list[dict])
                 - "bottleneck_workstations" (dict)
+                - "steady_state" (dict), only when config.SAMPLE_INTERVAL is set: see KPIMonitor.summary()
+                - "instrumentation" (dict), only when config.INSTRUMENT is set: see InstrumentedEnvironment.report()
               Other previously computed metrics are also included.
     """
-    env = simpy.Environment()
-    facility = ManufacturingFacility(env)
+    if env is None:
+        environment = InstrumentedEnvironment if config.INSTRUMENT else simpy.Environment
+        env = environment(initial_time=0 if snapshot is None else snapshot["time"])
+    if snapshot is None:
+        facility = ManufacturingFacility(env, config, seed)
+    else:
+        facility = ManufacturingFacility.from_snapshot(env, config, snapshot, seed)
+    if isinstance(env, InstrumentedEnvironment):
+        env.watch_queues(facility.stations)
 
     # Start simulation processes
     env.process(product_generator(env, facility))
-    env.process(accident_monitor(env))
+    env.process(accident_monitor(env, facility))
+    monitor = None
+    if config.SAMPLE_INTERVAL > 0:
+        monitor = KPIMonitor(facility, config.SAMPLE_INTERVAL)
+        env.process(monitor.run(env))
 
+    profiler = cProfile.Profile() if config.PROFILE_DIR is not None else None
     accident = False
+    start = time.perf_counter()
     try:
-        env.run(until=SimulationConfig().SIMULATION_TIME)
+        if profiler:
+            profiler.enable()
+        env.run(until=config.SIMULATION_TIME)
     except RuntimeError:
         print("Accident happened")
         accident = True
+    finally:
+        wall_time = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+            os.makedirs(config.PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(config.PROFILE_DIR, f"profile_{facility.streams.seed}.prof"))
+        if facility.trace:
+            facility.trace.close()
 
     actual_time = env.now
-
-    # Compute basic production metrics
-    accepted = facility.accepted_products
-    rejected = facility.rejected_products
-    total = accepted + rejected
-
-    # Production rejection percentage (by number and percentage)
-    rejection_percentage = (rejected / total * 100) if total > 0 else 0
-
-    # Average delay time: computed as the same as bottleneck delay in this example.
-    avg_delay = (sum(facility.station_waiting_time) + sum(facility.bin_waiting_time)) / total if total > 0 else 0
-
-    # Workstation status partition per station:
-    workstation_status = []
-    for i in range(SimulationConfig().NUM_STATIONS):
-        # Operational time is the busy time.
-        operational = facility.station_busy_time[i]
-        # Down time is recorded from maintenance downtime.
-        down_time = facility.maintenance_downtime[i]
-        # Waiting for restock (or idle) is what remains.
-        waiting = actual_time - operational
-        workstation_status.append({
-            "operational": operational,
-            "downtime": down_time,
-            "waiting_for_restock": waiting
-        })
-
-    # Analysis on bottleneck workstations using waiting times.
-    waiting_times = facility.station_waiting_time if hasattr(facility, 'station_waiting_time') else [0] * SimulationConfig().NUM_STATIONS
-    bottleneck_index = int(np.argmax(waiting_times)) if waiting_times else None
-    max_waiting_time = max(waiting_times) if waiting_times else 0
-    bottleneck_analysis = {
-        "waiting_times": waiting_times,
-        "bottleneck_station": bottleneck_index,
-        "max_waiting_time": max_waiting_time
-    }
-
-    # Average production time per workstation.
-    avg_production_time = []
-    for i in range(SimulationConfig().NUM_STATIONS):
-        if facility.station_counts[i] > 0:
-            prod_time = facility.station_busy_time[i] / facility.station_counts[i]
-        else:
-            prod_time = 0
-        avg_production_time.append(prod_time)
-
-    # Compile all metrics into the dictionary.
-    metrics = {
-        "accepted_products": accepted,
-        "rejected_products": rejected,
-        "total_products": total,
-        "occupancy_per_workstation": [
-            facility.station_busy_time[i] / actual_time for i in range(SimulationConfig().NUM_STATIONS)
-        ],
-        "avg_production_time": avg_production_time,
-        "production_rejection_percentage": rejection_percentage,
-        "avg_delay_time": avg_delay,
-        "accident_rate": int(accident) * 100,  # Expressed as percentage (0 or 100)
-        "workstation_status": workstation_status,
-        "bottleneck_workstations": bottleneck_analysis,
-        "supplier_occupancy": facility.restock_device_busy_time / (actual_time * SimulationConfig().RESTOCK_DEVICES),
-        "avg_fix_time": facility.total_maintenance_time / facility.total_maintenance_events if facility.total_maintenance_events > 0 else 0,
-        "avg_bottleneck_delay": avg_delay,
-        "faulty_product_rate": rejected / total if total > 0 else 0,
-        "accidents": int(accident)
-    }
+    metrics = collect_metrics(config, facility, actual_time, accident)
+    if config.INSTRUMENT and isinstance(env, InstrumentedEnvironment):
+        metrics["instrumentation"] = env.report(wall_time)
+    if monitor:
+        metrics["steady_state"] = monitor.summary(actual_time)
+        if config.SERIES_DIR is not None:
+            monitor.save(config.SERIES_DIR, facility.streams.seed)
     return metrics
 
-def run_multiple_simulations_dict(num_iterations):
+def take_snapshot(config, seed=None):
+    """
+    Runs one replication up to config.SIMULATION_TIME and captures the state of the facility,
+    so what-if branches can start from the warmed-up line.
+
+    Args:
+        config (SimulationConfig): The configuration of the warm-up.
+        seed (int): Seed of the warm-up's random streams. Fresh entropy is used when None.
+
+    Returns:
+        dict: The snapshot (see ManufacturingFacility.snapshot()).
+    """
+    env = simpy.Environment()
+    facility = ManufacturingFacility(env, config, seed)
+    env.process(product_generator(env, facility))
+    env.process(accident_monitor(env, facility))
+    try:
+        env.run(until=config.SIMULATION_TIME)
+    except RuntimeError:
+        raise RuntimeError(f"An accident halted the warm-up at {env.now:.2f}; try another seed.")
+    finally:
+        if facility.trace:
+            facility.trace.close()
+    return facility.snapshot()
+
+def replication_seeds(master_seed, num_iterations, start=0):
+    """
+    Derives one independent seed per replication from a master seed.
+
+    The seeds are spawned from a numpy SeedSequence, so replication i always gets the
+    same seed for a given master seed no matter how the work is split across workers
+    (or across successive calls).
+
+    Args:
+        master_seed (int): The master seed of the run.
+        num_iterations (int): The number of replications to derive seeds for.
+        start (int): Index of the first replication.
+
+    Returns:
+        list[int]: One seed per replication.
+    """
+    children = (np.random.SeedSequence(master_seed, spawn_key=(i,)) for i in range(start, start + num_iterations))
+    return [int(child.generate_state(1, np.uint64)[0]) for child in children]
+
+def load_branch_snapshot(config):
+    """
+    Loads the snapshot runs start from (config.FROM_SNAPSHOT).
+
+    Runs from a snapshot continue its clock, so config.SIMULATION_TIME is their absolute end time
+    and must come after the snapshot's time.
+
+    Args:
+        config (SimulationConfig): The configuration of the simulation.
+
+    Returns:
+        dict: The snapshot (see ManufacturingFacility.snapshot()).
+    """
+    snapshot = load_snapshot(config.FROM_SNAPSHOT)
+    if config.SIMULATION_TIME <= snapshot["time"]:
+        raise ValueError(f"--simulation_time ({config.SIMULATION_TIME}) is the absolute end time of runs from a "
+                         f"snapshot and must be later than the snapshot's time ({snapshot['time']}).")
+    return snapshot
+
+def run_batch(config, seeds):
+    """
+    Runs a batch of replications with the engine selected by config.ENGINE.
+
+    The SimPy engine runs the replications one by one, the fast engine computes the whole
+    batch at once with numpy (see fastpath.py) and the event engine runs them one by one
+    without SimPy (see eventcore.py).
+
+    Args:
+        config (SimulationConfig): The configuration of the simulation.
+        seeds (list[int]): Seed of each replication.
+
+    Returns:
+        list[dict]: One dictionary per replication, with the keys defined in run_simulation().
+    """
+    if config.ENGINE == "fast":
+        return run_fast_simulations(config, seeds)
+    if config.ENGINE == "event":
+        return run_event_simulations(config, seeds)
+    snapshot = load_branch_snapshot(config) if config.FROM_SNAPSHOT is not None else None
+    return [run_simulation(config, seed, snapshot=snapshot) for seed in seeds]
+
+def iter_simulations(config, num_iterations=None, start=0):
+    """
+    Runs the simulation multiple times and yields each iteration's result as soon as it is available.
+
+    Replications are fanned out across a process pool when more than one worker is requested.
+    Each replication gets its own seed derived from the master seed, so the results are
+    identical to a serial run with the same master seed. Results are yielded in replication order.
+
+    config.WORKERS sets the number of worker processes (0 uses every core), config.CHUNK_SIZE the
+    replications per batch handed to a worker (or to the fast engine) at a time, and config.SEED
+    the master seed (fresh entropy when unset).
+
+    Only a few batches per worker are in flight at any time, so the consumer can stop early
+    (e.g. once confidence intervals converge) without waiting for queued work.
+
+    Args:
+        config (SimulationConfig): The configuration of the simulation.
+        num_iterations (int): The number of simulation iterations to run. Runs until the
+                              consumer stops when None.
+        start (int): Index of the first replication to run, to resume an interrupted run.
+
+    Yields:
+        dict: The metrics of one replication, with the keys defined in run_simulation().
+    """
+    workers = config.WORKERS
+    chunk_size = config.CHUNK_SIZE
+    seed = config.SEED
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+        print(f"Master seed: {seed}")
+    if workers == 0:
+        workers = os.cpu_count()
+    total = "" if num_iterations is None else f"/{num_iterations}"
+
+    def batches():
+        index = start
+        while num_iterations is None or index < num_iterations:
+            size = chunk_size if num_iterations is None else min(chunk_size, num_iterations - index)
+            yield replication_seeds(seed, size, index)
+            index += size
+
+    completed = start
+    if workers <= 1:
+        for batch in batches():
+            for simulation_result in run_batch(config, batch):
+                completed += 1
+                print(f"Simulation {completed}{total}")
+                yield simulation_result
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending_batches = batches()
+    in_flight = deque(pool.submit(run_batch, config, batch) for batch in islice(pending_batches, 2 * workers))
+    try:
+        while in_flight:
+            batch_results = in_flight.popleft().result()
+            for batch in islice(pending_batches, 1):
+                in_flight.append(pool.submit(run_batch, config, batch))
+            for simulation_result in batch_results:
+                completed += 1
+                print(f"Simulation {completed}{total}")
+                yield simulation_result
+    finally:
+        # Do not wait for queued replications when the consumer stops early (e.g. Ctrl+C).
+        pool.shutdown(cancel_futures=True)
+
+def run_multiple_simulations_dict(config, num_iterations):
     """
     Runs the simulation multiple times and stores each iteration's result in a dictionary.
 
+    See iter_simulations() for how replications are parallelized and seeded.
+
     Args:
+        config (SimulationConfig): The configuration of the simulation.
         num_iterations (int): The number of simulation iterations to run.
 
     Returns:
         list[dict]: A list where each element is a dictionary representing one simulation
                     with the keys defined in run_simulation().
     """
-    all_results = []
-    for i in range(num_iterations):
-        print(f"Simulation {i + 1}/{num_iterations}")
-        simulation_result = run_simulation()
-        all_results.append(simulation_result)
-    return all_results
+    return list(iter_simulations(config, num_iterations))
 
 def export_results_to_json(results, generated_folder="Data", filename="simulator.json", backup_folder="Data/backup"):
     """
     Exports the simulation results to a JSON file with a common name for dashboard use.
     If a previous JSON file exists, it is moved to a backup folder with a timestamp.
 
+    This holds every result in memory; main() streams results with a ResultsWriter instead.
+
     Args:
         results (list[dict]): List of simulation result dictionaries.
         generated_folder (str): Folder where the JSON file will be saved.
@@ -140,13 +279,7 @@ def export_results_to_json(results, generated_folder="Data", filename="simulator
     filepath = os.path.join(generated_folder, filename)
 
     # If a previous file exists, move it to the backup folder with a timestamp.
-    if os.path.exists(filepath):
-        os.makedirs(backup_folder, exist_ok=True)
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"{timestamp}.json"
-        backup_path = os.path.join(backup_folder, backup_filename)
-        os.rename(filepath, backup_path)
-        print(f"Previous results backed up to {backup_path}")
+    backup_existing(filepath, backup_folder)
 
     # Export the new simulation results.
     with open(filepath, "w") as file:
@@ -165,24 +298,125 @@ def print_individual_results(results_list):
     Prints the simulation results for each iteration in the given format.
 
     Args:
-        results_list (list[dict]): List of dictionaries where each dictionary contains
-                                   simulation results for one day.
+        results_list (Iterable[dict]): Dictionaries where each dictionary contains
+                                       simulation results for one day.
     """
     for day_index, result in enumerate(results_list, start=1):
-        print(f"\nDay {day_index}:")
-        for key, value in result.items():
-            print(f"{key}: {value}")
+        print_result(day_index, result)
+
+def print_result(day_index, result):
+    """
+    Prints the simulation results of one iteration.
+
+    Args:
+        day_index (int): The 1-based index of the iteration.
+        result (dict): The simulation results of that day.
+    """
+    print(f"\nDay {day_index}:")
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+def print_stopping_report(rule):
+    """
+    Prints the confidence intervals of an adaptive run and the replications each metric needed.
+
+    Args:
+        rule (SequentialStopping): The stopping rule after the run.
+    """
+    print(f"\nStopped after {rule.count} replications ({rule.confidence:.0%} confidence, "
+          f"{rule.precision:.1%} relative precision):")
+    for metric, summary in rule.report().items():
+        needed = summary["replications"] or f"not converged within {rule.max_replications}"
+        print(f"{metric}: {summary['mean']} +- {summary['half_width']} (replications needed: {needed})")
 
 def main():
-    num_iterations = SimulationConfig().ITERATIONS
-    results_list = run_multiple_simulations_dict(num_iterations)
+    from sweep import result_options
+
+    args = build_parser().parse_args()
+    configure_logging(args.verbosity)
+    config = SimulationConfig.from_args(args)
+    num_iterations = config.ITERATIONS
+
+    if config.SAVE_SNAPSHOT is not None:
+        save_snapshot(take_snapshot(config, config.SEED), config.SAVE_SNAPSHOT)
+        return
+
+    if config.FROM_SNAPSHOT is not None:
+        try:
+            load_branch_snapshot(config)
+        except ValueError as error:
+            raise SystemExit(str(error))
+
+    # The manifest checkpointed with the results identifies the run, so --resume only continues matching work.
+    # It includes the options that change the shape of the results (e.g. KPI sampling), so a resumed run
+    # never mixes replications with and without them.
+    manifest = {"parameters": json.loads(json.dumps(config.parameters())), "snapshot": config.FROM_SNAPSHOT,
+                "options": result_options(config)}
+    if config.RESUME:
+        previous = read_manifest(RESULTS_PATH)
+        if previous is None:
+            raise SystemExit(f"Nothing to resume: {RESULTS_PATH} has no checkpoint manifest.")
+        if {key: previous.get(key) for key in manifest} != manifest:
+            raise SystemExit("The settings differ from the run being resumed; start a new run instead.")
+        if config.SEED is not None and config.SEED != previous["seed"]:
+            raise SystemExit(f"The run being resumed used --seed {previous['seed']}.")
+        config = config._replace(SEED=previous["seed"])
+    elif config.SEED is None:
+        config = config._replace(SEED=np.random.SeedSequence().entropy)
+        print(f"Master seed: {config.SEED}")
+    manifest["seed"] = config.SEED
+
+    # Instrumentation reports go to their own file next to the results.
+    instrumentation = (ResultsWriter(filename="simulator.instrumentation.ndjson", append=config.RESUME)
+                       if config.INSTRUMENT else None)
+
+    # Stream each replication to disk as it finishes and back up the previous results if they exist.
+    with ResultsWriter(append=config.RESUME, manifest=manifest) as writer:
+        completed = writer.count
+        if completed:
+            print(f"Resuming after {completed} completed replications")
+
+        # The dashboards read a pre-aggregated summary, updated with every replication.
+        # It records the run, so a summary left behind by another run is rebuilt from the results.
+        summary = (load_summary(summary_path(writer.path), writer.path, config.CONFIDENCE, manifest) if config.RESUME
+                   else ResultsSummary(config.CONFIDENCE, manifest))
+
+        # With a precision target, replicate until the confidence intervals are narrow enough.
+        rule = None
+        simulations = iter_simulations(config, num_iterations if config.PRECISION is None else None, completed)
+        results = simulations
+        if config.PRECISION is not None:
+            rule = SequentialStopping(config.PRECISION, config.CONFIDENCE, config.CI_METRICS,
+                                      config.MIN_REPLICATIONS, config.MAX_REPLICATIONS)
+            for result in iter_results(writer.path):
+                rule.add(result)
+            results = run_until_converged(simulations, rule)
+
+        try:
+            for day_index, result in enumerate(results, start=completed + 1):
+                if instrumentation:
+                    instrumentation.write(result.pop("instrumentation"))
+                print_result(day_index, result)
+                writer.write(result)
+                summary.add(result)
+        finally:
+            simulations.close()
+            summary.save(summary_path(writer.path))
+            if instrumentation:
+                instrumentation.close()
+    num_iterations = writer.count
+
+    if instrumentation and instrumentation.count:
+        print(f"\nInstrumentation: {json.dumps(summarize_reports(load_results(instrumentation.path)))}")
+
+    if rule is not None:
+        print_stopping_report(rule)
 
-    if SimulationConfig().PLOTTING:
-        plot_results(results_list, num_iterations)
+    if config.COLUMNS:
+        export_columns(writer.path, os.path.splitext(writer.path)[0] + ".npz")
 
-    print_individual_results(results_list)
-    # Export the results to the common JSON file and back up the previous one if it exists.
-    export_results_to_json(results_list)
+    if config.PLOTTING:
+        plot_results(load_results(writer.path), num_iterations)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,179 @@
+"""
+The monitor module samples the state of a facility over time and detects the warm-up period.
+
+End-of-run totals include the start-up transient of an empty line. A KPIMonitor process
+records queue lengths, bin levels, station and restock-device utilization and cumulative
+throughput at a fixed interval into preallocated numpy arrays; MSER-5 then finds where the
+transient ends so the steady-state statistics can leave it out.
+"""
+
+import os
+
+import numpy as np
+
+# Observations averaged into each batch by MSER-5.
+MSER_BATCH_SIZE = 5
+
+
+def mser(series, batch_size=MSER_BATCH_SIZE):
+    """
+    Finds the warm-up truncation point of a series with the MSER-m rule.
+
+    The series is averaged into batches of batch_size observations, and the number of batches d
+    deleted from the start is the one minimizing the squared standard error of the remaining batch
+    means, sum((Y_i - mean(Y[d:]))**2) / (n - d)**2. Only the first half of the series is
+    considered, since a minimum past it means the run is too short to reach steady state.
+
+    Parameters:
+        series (numpy.ndarray): Observations in time order.
+        batch_size (int): Observations per batch (5 for MSER-5).
+
+    Returns:
+        int: Number of leading observations to discard.
+    """
+    batches = len(series) // batch_size
+    if batches < 2:
+        return 0
+    means = np.asarray(series[:batches * batch_size], dtype=float).reshape(batches, batch_size).mean(axis=1)
+    # Suffix sums give the mean and sum of squares of every tail means[d:] in one pass.
+    remaining = np.arange(batches, 0, -1)
+    tail_sum = np.cumsum(means[::-1])[::-1]
+    tail_squares = np.cumsum(means[::-1] ** 2)[::-1]
+    statistic = (tail_squares - tail_sum ** 2 / remaining) / remaining ** 2
+    d = int(np.argmin(statistic[:mser_limit(len(series), batch_size) // batch_size + 1]))
+    return d * batch_size
+
+
+def mser_limit(length, batch_size=MSER_BATCH_SIZE):
+    """
+    Returns the largest truncation point mser() considers for a series of the given length.
+
+    A truncation point at the limit means the series never settled: the run is too short
+    (or the line is unstable, e.g. arrivals faster than the bottleneck can serve).
+    """
+    return (length // batch_size) // 2 * batch_size
+
+
+class KPIMonitor:
+    """
+    Samples the key performance indicators of a facility at a fixed interval.
+    """
+    def __init__(self, facility, interval):
+        """
+        Preallocates one row per sample up to the end of the simulation.
+
+        Parameters:
+            facility (ManufacturingFacility): The facility to sample.
+            interval (float): Time between samples.
+        """
+        config = facility.config
+        self.facility = facility
+        self.interval = interval
+        capacity = int(config.SIMULATION_TIME // interval) + 1
+        self.times = np.empty(capacity)
+        self.queue_lengths = np.empty((capacity, config.NUM_STATIONS), dtype=np.int32)
+        self.bin_levels = np.empty((capacity, config.NUM_STATIONS), dtype=np.int32)
+        self.station_busy = np.empty((capacity, config.NUM_STATIONS), dtype=np.int8)
+        self.restock_utilization = np.empty(capacity)
+        self.accepted = np.empty(capacity, dtype=np.int64)
+        self.count = 0
+
+    def run(self, env):
+        """
+        The sampling process; start it with env.process(monitor.run(env)).
+
+        Parameters:
+            env (simpy.Environment): The simulation environment.
+        """
+        facility = self.facility
+        stations = facility.stations
+        bins = facility.bins
+        restock_devices = facility.restock_devices
+        while self.count < len(self.times):
+            i = self.count
+            self.times[i] = env.now
+            self.queue_lengths[i] = [len(station.queue) for station in stations]
+            self.bin_levels[i] = [bin.level for bin in bins]
+            self.station_busy[i] = [station.count for station in stations]
+            self.restock_utilization[i] = restock_devices.count / restock_devices.capacity
+            self.accepted[i] = facility.accepted_products
+            self.count += 1
+            yield env.timeout(self.interval)
+
+    def series(self):
+        """
+        Returns the samples taken so far.
+
+        Returns:
+            dict[str, numpy.ndarray]: One array per indicator, with one row per sample.
+        """
+        n = self.count
+        return {
+            "time": self.times[:n],
+            "queue_lengths": self.queue_lengths[:n],
+            "bin_levels": self.bin_levels[:n],
+            "station_busy": self.station_busy[:n],
+            "restock_utilization": self.restock_utilization[:n],
+            "accepted": self.accepted[:n],
+        }
+
+    def warmup_samples(self):
+        """
+        Detects the warm-up period with MSER-5.
+
+        The rule is applied to the total queue length and to the throughput of every interval,
+        and the later of the two truncation points is used.
+
+        Returns:
+            tuple[int, bool]: Number of leading samples that belong to the transient, and whether
+                              the series settled before the end of the run (see mser_limit()).
+        """
+        n = self.count
+        if n < 2:
+            return 0, False
+        queued = self.queue_lengths[:n].sum(axis=1)
+        throughput = np.diff(self.accepted[:n])
+        truncations = [(mser(series), mser_limit(len(series))) for series in (queued, throughput)]
+        settled = all(truncation < limit for truncation, limit in truncations)
+        return max(truncation for truncation, _ in truncations), settled
+
+    def summary(self, end_time):
+        """
+        Computes the steady-state indicators of the run, leaving out the warm-up period.
+
+        Parameters:
+            end_time (float): The time the run ended.
+
+        Returns:
+            dict: The warm-up time, whether the run reached steady state, the steady-state mean queue
+                  length, bin level and utilization of every station, the mean restock-device
+                  utilization and the throughput.
+        """
+        n = self.count
+        if n == 0:
+            return {}
+        start, settled = self.warmup_samples()
+        start = min(start, n - 1)
+        warmup_time = float(self.times[start])
+        steady_time = end_time - warmup_time
+        accepted = self.facility.accepted_products - int(self.accepted[start])
+        return {
+            "warmup_time": warmup_time,
+            "steady_state_reached": settled,
+            "queue_length": self.queue_lengths[start:n].mean(axis=0).tolist(),
+            "bin_level": self.bin_levels[start:n].mean(axis=0).tolist(),
+            "station_utilization": self.station_busy[start:n].mean(axis=0).tolist(),
+            "restock_utilization": float(self.restock_utilization[start:n].mean()),
+            "throughput": accepted / steady_time if steady_time > 0 else 0,
+        }
+
+    def save(self, series_dir, seed):
+        """
+        Saves the sampled series of one replication as an NPZ archive.
+
+        Parameters:
+            series_dir (str): Directory of the archives.
+            seed (int): Seed of the replication, used to name its archive.
+        """
+        os.makedirs(series_dir, exist_ok=True)
+        np.savez_compressed(os.path.join(series_dir, f"series_{seed}.npz"), **self.series())
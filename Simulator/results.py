@@ -0,0 +1,285 @@
+"""
+The results module streams simulation results to disk and loads them back.
+
+Results are written as NDJSON: one compact JSON object per replication and per line, appended
+as soon as the replication finishes. Memory stays flat however many replications are run, and
+an interrupted run keeps every replication completed so far.
+"""
+
+import os
+import json
+import datetime
+
+import numpy as np
+
+
+def backup_existing(filepath, backup_folder):
+    """
+    Moves an existing results file to the backup folder, named after the file and stamped with the
+    current time (e.g. simulator_20250410_223156.ndjson). Its checkpoint manifest and summary, if
+    any, move with it, so the backup keeps the parameters of its run and nothing of it is left
+    behind for the next run.
+
+    Parameters:
+        filepath (str): Path of the results file.
+        backup_folder (str): Folder to store backup files.
+    """
+    if not os.path.exists(filepath):
+        return
+    os.makedirs(backup_folder, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    stem, extension = os.path.splitext(os.path.basename(filepath))
+    backup_path = os.path.join(backup_folder, f"{stem}_{timestamp}{extension}")
+    os.rename(filepath, backup_path)
+    for companion in (manifest_path, summary_path):
+        if os.path.exists(companion(filepath)):
+            os.rename(companion(filepath), companion(backup_path))
+    print(f"Previous results backed up to {backup_path}")
+
+
+def write_json_atomic(path, content):
+    """
+    Writes a JSON file under a temporary name and renames it, so an interrupted write never
+    leaves a partial file behind.
+
+    Parameters:
+        path (str): Path of the file.
+        content: JSON-serializable content.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(content, file, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+def manifest_path(path):
+    """
+    Returns the path of the checkpoint manifest kept next to a results file.
+    """
+    return os.path.splitext(path)[0] + ".manifest.json"
+
+
+def summary_path(path):
+    """
+    Returns the path of the summary kept next to a results file (see summary.ResultsSummary).
+    """
+    return os.path.splitext(path)[0] + ".summary.json"
+
+
+def read_manifest(path):
+    """
+    Reads the checkpoint manifest of a results file.
+
+    Parameters:
+        path (str): Path of the results file.
+
+    Returns:
+        dict: The manifest (see ResultsWriter), or None when the run left none behind.
+    """
+    if not os.path.exists(manifest_path(path)):
+        return None
+    with open(manifest_path(path)) as file:
+        return json.load(file)
+
+
+def _truncate_partial_line(path):
+    """
+    Cuts a truncated last line (left by a run killed mid-write) off a results file.
+
+    Returns:
+        int: Number of complete lines kept.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as file:
+        content = file.read()
+        end = content.rfind(b"\n") + 1
+        file.truncate(end)
+    return content.count(b"\n")
+
+
+class ResultsWriter:
+    """
+    Appends replication results to an NDJSON file as they finish.
+
+    When given a manifest, the writer also keeps a checkpoint next to the results file recording
+    it (e.g. the master seed and parameters of the run) together with the number of completed
+    replications, so an interrupted run can be resumed with append=True.
+    """
+    def __init__(self, generated_folder="Data", filename="simulator.ndjson", backup_folder="Data/backup", append=False,
+                 manifest=None):
+        """
+        Opens the results file. A previous file is moved to the backup folder unless appending.
+
+        Parameters:
+            generated_folder (str): Folder where the results file is saved.
+            filename (str): Name of the results file.
+            backup_folder (str): Folder to store backup files.
+            append (bool): Keep the existing file and add to it instead of starting a new one.
+                           A truncated last line is dropped first, and count starts at the
+                           number of replications already in the file.
+            manifest (dict): JSON-serializable description of the run to checkpoint with the results.
+        """
+        os.makedirs(generated_folder, exist_ok=True)
+        self.path = os.path.join(generated_folder, filename)
+        self.manifest = manifest
+        self.count = 0
+        if append:
+            self.count = _truncate_partial_line(self.path)
+        else:
+            backup_existing(self.path, backup_folder)
+            for companion in (manifest_path, summary_path):
+                if os.path.exists(companion(self.path)):
+                    os.remove(companion(self.path))
+        self._file = open(self.path, "a" if append else "w")
+        self._checkpoint()
+
+    def _checkpoint(self):
+        if self.manifest is not None:
+            write_json_atomic(manifest_path(self.path), {**self.manifest, "completed": self.count})
+
+    def write(self, result):
+        """
+        Appends one replication and flushes it, so it survives an interrupted run.
+
+        Parameters:
+            result (dict): Metrics of one replication, as returned by run_simulation().
+        """
+        self._file.write(json.dumps(result, separators=(",", ":")))
+        self._file.write("\n")
+        self._file.flush()
+        self.count += 1
+        self._checkpoint()
+
+    def close(self):
+        """
+        Closes the results file.
+        """
+        self._file.close()
+        print(f"Results successfully exported to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_results(path):
+    """
+    Iterates over the replications of a results file without loading the whole file.
+
+    Parameters:
+        path (str): An NDJSON results file, or a legacy JSON list (which is loaded in full).
+
+    Yields:
+        dict: The metrics of one replication.
+    """
+    if path.endswith(".json"):
+        with open(path) as file:
+            yield from json.load(file)
+        return
+    with open(path) as file:
+        for line in file:
+            # A run killed mid-write may leave a truncated last line behind.
+            if line.endswith("\n"):
+                yield json.loads(line)
+
+
+def load_results(path):
+    """
+    Loads every replication of a results file.
+
+    Parameters:
+        path (str): An NDJSON or legacy JSON results file.
+
+    Returns:
+        list[dict]: One dictionary per replication.
+    """
+    return list(iter_results(path))
+
+
+def flatten_result(result, prefix=""):
+    """
+    Flattens a result into column name -> value pairs.
+
+    Nested dictionaries are joined with dots (e.g. "bottleneck_workstations.waiting_times"),
+    and lists of dictionaries become one list per key (e.g. "workstation_status.downtime").
+
+    Parameters:
+        result (dict): Metrics of one replication.
+        prefix (str): Prefix of the column names.
+
+    Returns:
+        dict: Flat mapping of column names to numbers or lists of numbers.
+    """
+    columns = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            columns.update(flatten_result(value, f"{name}."))
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            for field in value[0]:
+                columns[f"{name}.{field}"] = [item[field] for item in value]
+        else:
+            columns[name] = value
+    return columns
+
+
+def load_columns(path, keys=None):
+    """
+    Loads a results file as numeric columns, one row per replication.
+
+    Parameters:
+        path (str): An NDJSON or legacy JSON results file.
+        keys (list[str]): Flattened column names to load (see flatten_result). Loads every column when None.
+
+    Returns:
+        dict[str, numpy.ndarray]: Columns of shape (replications,) for scalar metrics and
+                                  (replications, stations) for per-station metrics.
+    """
+    columns = {}
+    for result in iter_results(path):
+        flat = flatten_result(result)
+        for key in keys if keys is not None else flat:
+            columns.setdefault(key, []).append(flat[key])
+    return {key: np.array(values, dtype=float) for key, values in columns.items()}
+
+
+def export_columns(path, npz_path):
+    """
+    Converts a results file into a compressed columnar NPZ archive.
+
+    Parameters:
+        path (str): An NDJSON or legacy JSON results file.
+        npz_path (str): Path of the NPZ archive to write.
+    """
+    np.savez_compressed(npz_path, **load_columns(path))
+    print(f"Columns successfully exported to {npz_path}")
+
+
+def save_snapshot(snapshot, path):
+    """
+    Saves a facility snapshot (see ManufacturingFacility.snapshot()) as JSON.
+
+    Parameters:
+        snapshot (dict): The snapshot.
+        path (str): Path of the snapshot file.
+    """
+    write_json_atomic(path, snapshot)
+    print(f"Snapshot at time {snapshot['time']} saved to {path}")
+
+
+def load_snapshot(path):
+    """
+    Loads a facility snapshot saved by save_snapshot().
+
+    Parameters:
+        path (str): Path of the snapshot file.
+
+    Returns:
+        dict: The snapshot.
+    """
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,269 @@
+"""
+The stopping module decides how many replications a run needs.
+
+Instead of a fixed --iterations count, a run can keep replicating until the confidence interval
+of every tracked metric is narrow enough: each replication updates online (Welford) mean and
+variance accumulators, and the run stops once every half-width is within the relative precision
+target of its mean.
+"""
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from results import flatten_result
+
+DEFAULT_METRICS = ("accepted_products", "avg_delay_time", "occupancy_per_workstation")
+
+
+# Degrees of freedom up to which the Cornish-Fisher t quantile is refined against the exact distribution.
+EXACT_T_DEGREES = 5
+
+
+def _t_cdf(t, degrees_of_freedom):
+    """
+    Returns the cumulative distribution function of Student's t distribution with an integer
+    number of degrees of freedom, from its closed-form finite series.
+    """
+    v = degrees_of_freedom
+    theta = math.atan(t / math.sqrt(v))
+    cos2 = math.cos(theta) ** 2
+    if v % 2:
+        term, total = 1.0, 1.0 if v > 1 else 0.0
+        for k in range(1, (v - 1) // 2):
+            term *= cos2 * (2 * k) / (2 * k + 1)
+            total += term
+        return 0.5 + (theta + math.sin(theta) * math.cos(theta) * total) / math.pi
+    term, total = 1.0, 1.0
+    for k in range(1, v // 2):
+        term *= cos2 * (2 * k - 1) / (2 * k)
+        total += term
+    return 0.5 + 0.5 * math.sin(theta) * total
+
+
+def t_quantile(probability, degrees_of_freedom):
+    """
+    Approximates the quantile of Student's t distribution.
+
+    Uses the exact closed forms for 1 and 2 degrees of freedom, and otherwise the Cornish-Fisher
+    expansion of the t quantile around the normal one, which is within 0.05% from 6 degrees of
+    freedom on for confidence levels up to 99%. Up to EXACT_T_DEGREES degrees of freedom, where
+    the expansion is off by up to 1%, it is refined with Newton steps on the exact distribution
+    function.
+
+    Parameters:
+        probability (float): Cumulative probability of the quantile.
+        degrees_of_freedom (int): Degrees of freedom of the distribution.
+
+    Returns:
+        float: The quantile.
+    """
+    if degrees_of_freedom == 1:
+        return math.tan(math.pi * (probability - 0.5))
+    if degrees_of_freedom == 2:
+        return (2 * probability - 1) / math.sqrt(2 * probability * (1 - probability))
+    z = NormalDist().inv_cdf(probability)
+    v = degrees_of_freedom
+    t = (z
+         + (z ** 3 + z) / (4 * v)
+         + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * v ** 2)
+         + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * v ** 3)
+         + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * v ** 4))
+    if v <= EXACT_T_DEGREES:
+        log_scale = math.lgamma((v + 1) / 2) - math.lgamma(v / 2) - 0.5 * math.log(v * math.pi)
+        for _ in range(20):
+            density = math.exp(log_scale - (v + 1) / 2 * math.log1p(t * t / v))
+            step = (_t_cdf(t, v) - probability) / density
+            t -= step
+            if abs(step) < 1e-12 * max(1.0, abs(t)):
+                break
+    return t
+
+
+class RunningStatistics:
+    """
+    Online mean and variance of a scalar or per-station metric (Welford's algorithm).
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def add(self, value):
+        """
+        Adds one observation.
+
+        Parameters:
+            value (float | list[float]): The observation.
+        """
+        value = np.asarray(value, dtype=float)
+        self.count += 1
+        if self.mean is None:
+            self.mean = value.copy()
+            self._m2 = np.zeros_like(value)
+            return
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """
+        Adds the observations summarized by another accumulator (Chan et al.'s parallel update).
+
+        Parameters:
+            other (RunningStatistics): The accumulator to merge in.
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self._m2 = other.count, other.mean.copy(), other._m2.copy()
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self._m2 = self._m2 + other._m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    def get_state(self):
+        """
+        Returns:
+            dict: JSON-serializable state of the accumulator, for from_state().
+        """
+        if self.count == 0:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.mean.tolist(), "m2": self._m2.tolist()}
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Recreates an accumulator from a state returned by get_state().
+        """
+        statistics = cls()
+        statistics.count = state["count"]
+        if statistics.count:
+            statistics.mean = np.array(state["mean"], dtype=float)
+            statistics._m2 = np.array(state["m2"], dtype=float)
+        return statistics
+
+    @property
+    def variance(self):
+        """
+        Sample variance of the observations (zero until there are two of them).
+        """
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return self._m2 / (self.count - 1)
+
+    def half_width(self, confidence):
+        """
+        Half-width of the t confidence interval of the mean.
+
+        Parameters:
+            confidence (float): Confidence level, e.g. 0.95.
+
+        Returns:
+            numpy.ndarray: The half-width (infinite until there are two observations).
+        """
+        if self.count < 2:
+            return np.full_like(self.mean, math.inf)
+        quantile = t_quantile(0.5 + confidence / 2, self.count - 1)
+        return quantile * np.sqrt(self.variance / self.count)
+
+
+class SequentialStopping:
+    """
+    Stopping rule of an adaptive run: stop once every tracked metric's confidence interval
+    half-width is within `precision` times the absolute value of its mean.
+
+    Per-station metrics converge when every station does. A metric whose mean is zero
+    converges once its half-width is zero too.
+    """
+    def __init__(self, precision, confidence=0.95, metrics=DEFAULT_METRICS, min_replications=10, max_replications=10000):
+        """
+        Parameters:
+            precision (float): Relative half-width target, e.g. 0.01 for +-1% of the mean.
+            confidence (float): Confidence level of the intervals.
+            metrics (Iterable[str]): Flattened metric names to track (see results.flatten_result).
+            min_replications (int): Replications run before the rule is first checked.
+            max_replications (int): Replications after which the run stops regardless.
+        """
+        if min_replications < 2:
+            raise ValueError("Confidence intervals need at least 2 replications; raise --min_replications.")
+        self.precision = precision
+        self.confidence = confidence
+        self.min_replications = min_replications
+        self.max_replications = max_replications
+        self.statistics = {metric: RunningStatistics() for metric in metrics}
+        # Replication count at which each metric last became converged (None while it is not).
+        self.converged_at = dict.fromkeys(self.statistics)
+        self.count = 0
+
+    def add(self, result):
+        """
+        Updates the accumulators with one replication.
+
+        Parameters:
+            result (dict): Metrics of one replication, as returned by run_simulation().
+        """
+        flat = flatten_result(result)
+        self.count += 1
+        for metric, statistics in self.statistics.items():
+            statistics.add(flat[metric])
+            if self.count < self.min_replications:
+                continue
+            if self._converged(statistics):
+                if self.converged_at[metric] is None:
+                    self.converged_at[metric] = self.count
+            else:
+                self.converged_at[metric] = None
+
+    def _converged(self, statistics):
+        return bool(np.all(statistics.half_width(self.confidence) <= self.precision * np.abs(statistics.mean)))
+
+    def done(self):
+        """
+        Returns:
+            bool: Whether the run can stop.
+        """
+        if self.count >= self.max_replications:
+            return True
+        return self.count >= self.min_replications and all(count is not None for count in self.converged_at.values())
+
+    def report(self):
+        """
+        Summarizes the estimates of the tracked metrics.
+
+        Returns:
+            dict: For every metric, its mean, confidence interval half-width and the replications it
+                  needed to converge (None when the run stopped at max_replications before it did).
+        """
+        return {
+            metric: {
+                "mean": statistics.mean.tolist(),
+                "half_width": statistics.half_width(self.confidence).tolist(),
+                "replications": self.converged_at[metric],
+            }
+            for metric, statistics in self.statistics.items()
+        }
+
+
+def run_until_converged(results, rule):
+    """
+    Feeds replications to a stopping rule and passes them on until the rule is satisfied.
+
+    Parameters:
+        results (Iterable[dict]): Replication results, e.g. from main.iter_simulations(config, None).
+        rule (SequentialStopping): The stopping rule.
+
+    Yields:
+        dict: Every replication consumed, in order. Nothing when the rule is already satisfied
+              (e.g. by the replications of a resumed run).
+    """
+    if rule.done():
+        return
+    for result in results:
+        rule.add(result)
+        yield result
+        if rule.done():
+            return
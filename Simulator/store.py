@@ -0,0 +1,395 @@
+"""
+The store module keeps result sets in a memory-mapped columnar store and answers queries about them
+over HTTP.
+
+Every result set (one results file, or the list returned by run_multiple_simulations_dict()) is
+stored as a folder with one .npy file per flattened metric column (see results.flatten_result) and
+a meta.json with its parameters, creation time and columns. Columns are memory-mapped when queried,
+so the service only reads the columns and sets a query needs, however many sets the store holds.
+The store's index.json lists every set; the service indexes it by parameter value and by creation
+time to select the sets of a query without opening them. A results file is stored once: adding it
+again (e.g. after resuming its run) replaces its set.
+
+Endpoints (JSON responses, CORS enabled so the dashboards can fetch them):
+
+    GET /sets?bin_capacity=25&since=2026-01-01     Sets matching the parameter filters and time range
+    GET /sets/<id>                                 Metadata of a set
+    GET /query?metric=occupancy_per_workstation&aggregate=histogram&bins=20&restock_devices_count=3
+        Values ("values"), statistics ("summary", the default) or histogram ("histogram") of a metric
+        over the matching sets, per station for per-station metrics. group_by=<parameter> splits the
+        answer by the value of a parameter.
+
+Parameter filters use the command-line parameter names with JSON values (e.g.
+station_failure_probs=[0.02,0.01,0.05,0.07,0.07,0.06]); since and until are ISO timestamps.
+
+Usage:
+    python store.py add Data/simulator.ndjson Data/backup/*.ndjson
+    python store.py serve --port 8000
+"""
+
+import os
+import json
+import math
+import shutil
+import hashlib
+import logging
+import argparse
+import datetime
+from bisect import bisect_left, bisect_right, insort
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from results import flatten_result, iter_results, read_manifest, write_json_atomic
+from summary import QUANTILES
+from utils import configure_logging
+
+STORE_FOLDER = os.path.join("Data", "store")
+AGGREGATES = ("values", "summary", "histogram")
+# Query string entries that are not parameter filters.
+QUERY_OPTIONS = ("metric", "aggregate", "bins", "group_by", "since", "until")
+
+
+def _index_key(value):
+    """
+    Returns a hashable key for a parameter value, so that e.g. 25 and 25.0 or a list and a tuple match.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_index_key(item) for item in value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def _jsonable(array):
+    """
+    Converts an array to nested lists, with None for NaN (e.g. a run without a bottleneck).
+    """
+    values = np.asarray(array, dtype=float)
+    if values.ndim == 0:
+        return None if math.isnan(values) else float(values)
+    if values.ndim > 1:
+        return [_jsonable(row) for row in values]
+    return [None if math.isnan(value) else value for value in values.tolist()]
+
+
+class ResultStore:
+    """
+    Folder of result sets stored as memory-mapped columns, indexed by parameter value and creation time.
+    """
+    def __init__(self, folder=STORE_FOLDER):
+        """
+        Opens (or creates, on the first add) a store.
+
+        Parameters:
+            folder (str): Folder of the store.
+        """
+        self.folder = folder
+        self.sets = {}
+        self.by_parameter = {}
+        self.by_time = []
+        self._loaded_mtime = None
+        self.refresh()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.folder, "index.json")
+
+    def refresh(self):
+        """
+        Reloads the index when another process (e.g. `store.py add`) has changed it.
+        """
+        mtime = os.path.getmtime(self.index_path) if os.path.exists(self.index_path) else None
+        if mtime == self._loaded_mtime:
+            return
+        self._loaded_mtime = mtime
+        self.sets, self.by_parameter, self.by_time = {}, {}, []
+        if mtime is None:
+            return
+        with open(self.index_path) as file:
+            for meta in json.load(file):
+                self._index(meta)
+
+    def _index(self, meta):
+        set_id = meta["id"]
+        self.sets[set_id] = meta
+        for name, value in meta["parameters"].items():
+            self.by_parameter.setdefault(name, {}).setdefault(_index_key(value), set()).add(set_id)
+        insort(self.by_time, (meta["created"], set_id))
+
+    def add(self, path, parameters=None, created=None):
+        """
+        Adds a results file to the store.
+
+        Parameters:
+            path (str): An NDJSON or legacy JSON results file.
+            parameters (dict): Parameters of the run, by command-line name. Taken from the run's
+                               manifest when None (and empty when it has none).
+            created (str): ISO creation time of the set. The file's modification time when None.
+
+        Returns:
+            dict: Metadata of the set, which replaces the one previously stored from the same file.
+        """
+        if parameters is None:
+            parameters = (read_manifest(path) or {}).get("parameters", {})
+        if created is None:
+            created = datetime.datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+        return self.add_results(iter_results(path), parameters, created, os.path.abspath(path))
+
+    def add_results(self, results, parameters, created=None, source=None):
+        """
+        Adds replication results to the store as a new set.
+
+        Parameters:
+            results (Iterable[dict]): Results of the replications, e.g. from run_multiple_simulations_dict().
+                                      Values a replication lacks are stored as NaN.
+            parameters (dict): Parameters of the run, by command-line name (see SimulationConfig.parameters()).
+            created (str): ISO creation time of the set. The current time when None.
+            source (str): Where the results came from, kept in the metadata. A set from the same
+                          source replaces the previous one.
+
+        Returns:
+            dict: Metadata of the new set.
+        """
+        columns = {}
+        count = 0
+        for result in results:
+            # Rows may differ in columns (e.g. a run resumed with KPI sampling): a column missing
+            # from a row gets None there, so every column keeps one value per replication.
+            for key, value in flatten_result(result).items():
+                columns.setdefault(key, [None] * count).append(value)
+            count += 1
+            for values in columns.values():
+                if len(values) < count:
+                    values.append(None)
+        created = created or datetime.datetime.now().isoformat(timespec="seconds")
+        parameters = json.loads(json.dumps(parameters))
+        identity = source if source is not None else [created, parameters]
+        set_id = hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()[:12]
+
+        folder = os.path.join(self.folder, set_id)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.makedirs(folder)
+        shapes = {}
+        for key, values in columns.items():
+            sample = next((value for value in values if value is not None), None)
+            missing = [np.nan] * len(sample) if isinstance(sample, list) else np.nan
+            array = np.array([missing if value is None else value for value in values], dtype=float)
+            np.save(os.path.join(folder, f"{key}.npy"), array)
+            shapes[key] = list(array.shape[1:])
+        meta = {
+            "id": set_id,
+            "created": created,
+            "source": source,
+            "replications": count,
+            "parameters": parameters,
+            "columns": shapes,
+        }
+        write_json_atomic(os.path.join(folder, "meta.json"), meta)
+
+        self.refresh()
+        self.sets[set_id] = meta
+        write_json_atomic(self.index_path, sorted(self.sets.values(), key=lambda item: (item["created"], item["id"])))
+        # Reindex from the new file, which drops the entries of a replaced set.
+        self._loaded_mtime = None
+        self.refresh()
+        print(f"Stored {meta['replications']} replications from {source or 'memory'} as set {set_id}")
+        return meta
+
+    def find(self, parameters=None, since=None, until=None):
+        """
+        Selects the sets matching parameter values and a creation time range.
+
+        Parameters:
+            parameters (dict): Required parameter values, by command-line name.
+            since (str): Earliest ISO creation time (inclusive).
+            until (str): Latest ISO creation time (inclusive; a date covers the whole day).
+
+        Returns:
+            list[str]: Ids of the matching sets, oldest first.
+        """
+        start = bisect_left(self.by_time, (since,)) if since else 0
+        end = bisect_right(self.by_time, (until + "\uffff",)) if until else len(self.by_time)
+        matching = [set_id for _, set_id in self.by_time[start:end]]
+        for name, value in (parameters or {}).items():
+            selected = self.by_parameter.get(name, {}).get(_index_key(value), set())
+            matching = [set_id for set_id in matching if set_id in selected]
+        return matching
+
+    def column(self, set_id, metric):
+        """
+        Memory-maps a column of a set.
+
+        Parameters:
+            set_id (str): Id of the set.
+            metric (str): Flattened metric name.
+
+        Returns:
+            numpy.ndarray: The read-only column, one row per replication.
+        """
+        if metric not in self.sets[set_id]["columns"]:
+            raise KeyError(f"Set {set_id} has no metric {metric}")
+        return np.load(os.path.join(self.folder, set_id, f"{metric}.npy"), mmap_mode="r")
+
+    def query(self, metric, parameters=None, since=None, until=None, aggregate="summary", bins=20, group_by=None):
+        """
+        Aggregates a metric over the matching sets.
+
+        Parameters:
+            metric (str): Flattened metric name.
+            parameters (dict): Required parameter values (see find()).
+            since (str): Earliest ISO creation time.
+            until (str): Latest ISO creation time.
+            aggregate (str): "values", "summary" or "histogram".
+            bins (int): Number of histogram bins.
+            group_by (str): Parameter to split the answer by. The matching sets form one group when None.
+
+        Returns:
+            dict: The metric, the aggregate and one entry per group with its parameter value, sets,
+                  replication count and result.
+        """
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate {aggregate}; use one of {', '.join(AGGREGATES)}")
+        groups = {}
+        for set_id in self.find(parameters, since, until):
+            if metric not in self.sets[set_id]["columns"]:
+                continue
+            value = self.sets[set_id]["parameters"].get(group_by) if group_by else None
+            groups.setdefault(json.dumps(value), (value, []))[1].append(set_id)
+
+        answer = []
+        for value, set_ids in groups.values():
+            values = np.concatenate([self.column(set_id, metric) for set_id in set_ids])
+            answer.append({
+                "value": value,
+                "sets": set_ids,
+                "replications": len(values),
+                "result": self._aggregate(values, aggregate, bins),
+            })
+        return {"metric": metric, "aggregate": aggregate, "group_by": group_by, "groups": answer}
+
+    @staticmethod
+    def _aggregate(values, aggregate, bins):
+        if aggregate == "values":
+            return _jsonable(values)
+        if aggregate == "summary":
+            return {
+                "mean": _jsonable(np.nanmean(values, axis=0)),
+                "std": _jsonable(np.nanstd(values, axis=0, ddof=1)) if len(values) > 1 else None,
+                "min": _jsonable(np.nanmin(values, axis=0)),
+                "max": _jsonable(np.nanmax(values, axis=0)),
+                "quantiles": {str(q): _jsonable(quantile)
+                              for q, quantile in zip(QUANTILES, np.nanquantile(values, QUANTILES, axis=0))},
+            }
+        edges = np.linspace(np.nanmin(values), np.nanmax(values), bins + 1)
+        columns = values.reshape(len(values), -1).T
+        counts = [np.histogram(column[~np.isnan(column)], edges)[0].tolist() for column in columns]
+        return {"edges": edges.tolist(), "counts": counts[0] if values.ndim == 1 else counts}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Answers the /sets and /query endpoints from the server's store.
+    """
+    def do_OPTIONS(self):
+        self._send(204, None)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        store = self.server.store
+        store.refresh()
+        parameters = {key: self._parse_value(value) for key, value in query.items() if key not in QUERY_OPTIONS}
+        try:
+            if url.path == "/sets":
+                set_ids = store.find(parameters, query.get("since"), query.get("until"))
+                self._send(200, {"sets": [store.sets[set_id] for set_id in set_ids]})
+            elif url.path.startswith("/sets/"):
+                set_id = url.path[len("/sets/"):]
+                if set_id not in store.sets:
+                    self._send(404, {"error": f"No set {set_id}"})
+                    return
+                self._send(200, store.sets[set_id])
+            elif url.path == "/query":
+                if "metric" not in query:
+                    raise ValueError("A query needs a metric")
+                self._send(200, store.query(query["metric"], parameters, query.get("since"), query.get("until"),
+                                            query.get("aggregate", "summary"), int(query.get("bins", 20)),
+                                            query.get("group_by")))
+            else:
+                self._send(404, {"error": f"Unknown endpoint {url.path}"})
+        except (KeyError, ValueError) as error:
+            self._send(400, {"error": str(error)})
+
+    @staticmethod
+    def _parse_value(value):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
+    def _send(self, status, content):
+        body = json.dumps(content, separators=(",", ":")).encode() if content is not None else b""
+        self.send_response(status)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        if content is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+def serve(store, host="127.0.0.1", port=8000):
+    """
+    Serves queries about a store until interrupted.
+
+    Parameters:
+        store (ResultStore): The store.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+    """
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.store = store
+    print(f"Serving {len(store.sets)} result sets from {store.folder} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped result store and query service")
+    parser.add_argument("--store", default=STORE_FOLDER, help="Folder of the store")
+    parser.add_argument("--verbosity", type=int, default=100, help="Logging level")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add = subparsers.add_parser("add", help="Add results files to the store")
+    add.add_argument("results", nargs="+", help="NDJSON or JSON results files")
+    add.add_argument("--parameters", type=json.loads, default=None,
+                     help="Parameters of the runs as JSON (read from their manifests by default)")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve queries over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+
+    args = parser.parse_args()
+    configure_logging(args.verbosity)
+    store = ResultStore(args.store)
+    if args.command == "add":
+        for path in args.results:
+            store.add(path, args.parameters)
+    else:
+        serve(store, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+The summary module pre-aggregates simulation results for the dashboards.
+
+A summary holds, for every scalar metric, its mean, confidence interval, extremes, quantiles and a
+histogram; for every per-station metric, the mean and confidence interval of each station; and how
+often each station was the bottleneck. It is a few kilobytes however many replications it covers,
+and it is updated one replication at a time, so adding replications never re-reads the old ones.
+A summary records the run it belongs to (the manifest of its results file), so a summary left
+behind by another run is rebuilt from the results instead of being extended.
+
+Histograms use sparse fixed-width bins whose width is a power of ten (three significant digits of
+the first non-zero value), so summaries built separately can always be merged. When the values
+spread over more than MAX_BINS bins, the width grows tenfold, which keeps the histogram small.
+
+Usage:
+    python summary.py Data/simulator.ndjson --output Data/simulator.summary.json
+"""
+
+import os
+import json
+import math
+import argparse
+
+import numpy as np
+
+from results import flatten_result, iter_results, summary_path, write_json_atomic
+from stopping import RunningStatistics
+
+BOTTLENECK_KEY = "bottleneck_workstations.bottleneck_station"
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# Largest number of non-empty histogram bins before the bin width grows tenfold.
+MAX_BINS = 50
+
+
+class Histogram:
+    """
+    Sparse histogram with fixed-width bins: bin i counts the values in [i * width, (i + 1) * width).
+    """
+    def __init__(self, width=None, counts=None):
+        """
+        Parameters:
+            width (float): Width of the bins. Chosen from the first non-zero value when None.
+            counts (dict[int, int]): Count of every non-empty bin.
+        """
+        self.width = width
+        self.counts = dict(counts or {})
+
+    def add(self, value):
+        """
+        Counts one value.
+        """
+        if self.width is None:
+            if value == 0:
+                self.counts[0] = self.counts.get(0, 0) + 1
+                return
+            self.width = 10.0 ** (math.floor(math.log10(abs(value))) - 2)
+        index = math.floor(value / self.width)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self._cap()
+
+    def _cap(self):
+        while len(self.counts) > MAX_BINS:
+            width = 10.0 ** (round(math.log10(self.width)) + 1)
+            self.counts, self.width = self._rebinned(width), width
+
+    def _rebinned(self, width):
+        ratio = round(width / self.width)
+        counts = {}
+        for index, count in self.counts.items():
+            counts[index // ratio] = counts.get(index // ratio, 0) + count
+        return counts
+
+    def merge(self, other):
+        """
+        Adds the counts of another histogram, re-binning the finer of the two into the coarser.
+        """
+        if other.width is None or self.width is None:
+            # A histogram without a width has only counted zeros, which fall in bin 0 at any width.
+            self.width = self.width or other.width
+            other_counts = other.counts
+        elif other.width > self.width:
+            self.counts, self.width = self._rebinned(other.width), other.width
+            other_counts = other.counts
+        else:
+            other_counts = other._rebinned(self.width) if other.width < self.width else other.counts
+        for index, count in other_counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self._cap()
+
+    def quantile(self, q, low, high):
+        """
+        Estimates a quantile by interpolating within the bin that holds it.
+
+        Parameters:
+            q (float): The probability, between 0 and 1.
+            low (float): The smallest value counted.
+            high (float): The largest value counted.
+
+        Returns:
+            float: The estimate, clipped to [low, high].
+        """
+        width = self.width or 0
+        total = sum(self.counts.values())
+        target = q * total
+        cumulative = 0
+        for index in sorted(self.counts):
+            count = self.counts[index]
+            if cumulative + count >= target:
+                estimate = (index + (target - cumulative) / count) * width
+                return min(max(estimate, low), high)
+            cumulative += count
+        return high
+
+    def get_state(self):
+        return {"width": self.width, "bins": {str(index): count for index, count in sorted(self.counts.items())}}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["width"], {int(index): count for index, count in state["bins"].items()})
+
+
+class ScalarSummary:
+    """
+    Running mean, variance, extremes and histogram of a scalar metric.
+    """
+    def __init__(self):
+        self.statistics = RunningStatistics()
+        self.histogram = Histogram()
+        self.low = math.inf
+        self.high = -math.inf
+
+    def add(self, value):
+        self.statistics.add(value)
+        self.histogram.add(value)
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+
+    def merge(self, other):
+        self.statistics.merge(other.statistics)
+        self.histogram.merge(other.histogram)
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+
+    def get_state(self, confidence):
+        statistics = self.statistics
+        return {
+            "count": statistics.count,
+            "mean": float(statistics.mean),
+            "std": float(np.sqrt(statistics.variance)),
+            "ci_half_width": float(statistics.half_width(confidence)) if statistics.count > 1 else None,
+            "min": self.low,
+            "max": self.high,
+            "quantiles": {str(q): self.histogram.quantile(q, self.low, self.high) for q in QUANTILES},
+            "histogram": self.histogram.get_state(),
+            "m2": float(statistics.get_state()["m2"]),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        summary = cls()
+        summary.statistics = RunningStatistics.from_state(state)
+        summary.histogram = Histogram.from_state(state["histogram"])
+        summary.low = state["min"]
+        summary.high = state["max"]
+        return summary
+
+
+class ResultsSummary:
+    """
+    Incrementally updated summary of the replications of a run.
+    """
+    def __init__(self, confidence=0.95, run=None):
+        """
+        Parameters:
+            confidence (float): Confidence level of the intervals.
+            run (dict): JSON-serializable description of the run summarized (e.g. its manifest).
+        """
+        self.confidence = confidence
+        self.run = run
+        self.count = 0
+        self.scalars = {}
+        self.stations = {}
+        self.bottleneck_counts = []
+
+    def add(self, result):
+        """
+        Adds one replication.
+
+        Parameters:
+            result (dict): Metrics of one replication, as returned by run_simulation().
+        """
+        self.count += 1
+        for key, value in flatten_result(result).items():
+            if key == BOTTLENECK_KEY:
+                if value is not None:
+                    self.bottleneck_counts += [0] * (value + 1 - len(self.bottleneck_counts))
+                    self.bottleneck_counts[value] += 1
+            elif isinstance(value, list):
+                self.stations.setdefault(key, RunningStatistics()).add(value)
+            elif value is not None:
+                self.scalars.setdefault(key, ScalarSummary()).add(float(value))
+
+    def merge(self, other):
+        """
+        Adds the replications summarized by another summary (e.g. from another run or worker).
+
+        Parameters:
+            other (ResultsSummary): The summary to merge in.
+        """
+        self.count += other.count
+        for key, summary in other.scalars.items():
+            self.scalars.setdefault(key, ScalarSummary()).merge(summary)
+        for key, statistics in other.stations.items():
+            self.stations.setdefault(key, RunningStatistics()).merge(statistics)
+        counts = other.bottleneck_counts
+        self.bottleneck_counts += [0] * (len(counts) - len(self.bottleneck_counts))
+        for station, count in enumerate(counts):
+            self.bottleneck_counts[station] += count
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The summary in the format read by the dashboards and by from_dict().
+        """
+        return {
+            "replications": self.count,
+            "confidence": self.confidence,
+            "run": self.run,
+            "metrics": {key: summary.get_state(self.confidence) for key, summary in self.scalars.items()},
+            "stations": {
+                key: {
+                    **statistics.get_state(),
+                    "ci_half_width": statistics.half_width(self.confidence).tolist() if statistics.count > 1 else None,
+                }
+                for key, statistics in self.stations.items()
+            },
+            "bottleneck_counts": self.bottleneck_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, content):
+        """
+        Recreates a summary from the output of to_dict().
+        """
+        summary = cls(content["confidence"], content.get("run"))
+        summary.count = content["replications"]
+        summary.scalars = {key: ScalarSummary.from_state(state) for key, state in content["metrics"].items()}
+        summary.stations = {key: RunningStatistics.from_state(state) for key, state in content["stations"].items()}
+        summary.bottleneck_counts = list(content["bottleneck_counts"])
+        return summary
+
+    def save(self, path):
+        """
+        Writes the summary as JSON.
+
+        Parameters:
+            path (str): Path of the summary file.
+        """
+        write_json_atomic(path, self.to_dict())
+
+
+def load_summary(path, results_path=None, confidence=0.95, run=None):
+    """
+    Loads a summary file, catching up with replications appended to the results since it was saved.
+
+    Parameters:
+        path (str): Path of the summary file. A new summary is started when it does not exist.
+        results_path (str): Results file the summary covers; its replications past the summary's
+                            count are added.
+        confidence (float): Confidence level of a new summary.
+        run (dict): The run the summary must belong to. A summary of another run is discarded and
+                    rebuilt from the results.
+
+    Returns:
+        ResultsSummary: The summary.
+    """
+    if os.path.exists(path):
+        with open(path) as file:
+            summary = ResultsSummary.from_dict(json.load(file))
+    else:
+        summary = ResultsSummary(confidence, run)
+    if run is not None and summary.run != run:
+        summary = ResultsSummary(summary.confidence, run)
+    if results_path is None or not os.path.exists(results_path):
+        return summary
+    covered = summary.count
+    seen = 0
+    for seen, result in enumerate(iter_results(results_path), start=1):
+        if seen > covered:
+            summary.add(result)
+    if seen < covered:
+        # The summary belongs to a longer (e.g. previous) run: rebuild it from the results.
+        summary = ResultsSummary(summary.confidence, summary.run)
+        for result in iter_results(results_path):
+            summary.add(result)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize simulation results for the dashboards")
+    parser.add_argument("results", nargs="+", help="NDJSON or JSON results files")
+    parser.add_argument("--output", default=None, help="Path of the summary (next to the first results file by default)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    args = parser.parse_args()
+
+    output = args.output or summary_path(args.results[0])
+    summary = ResultsSummary(args.confidence)
+    for path in args.results:
+        for result in iter_results(path):
+            summary.add(result)
+    summary.save(output)
+    print(f"Summary of {summary.count} replications saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+The sweep module runs parameter sweeps (designs of experiments) over the simulation configuration.
+
+A sweep is described by a JSON spec with one of the following designs:
+
+    {"grid": {"bin_capacity": [15, 25, 35], "restock_devices_count": [2, 3, 4]}}
+    {"latin_hypercube": {"samples": 20, "ranges": {"bin_capacity": [10, 40], "restock_time_mean": [1.0, 3.0]}}}
+    {"configs": [{"bin_capacity": 15}, {"bin_capacity": 35, "maintenance_check_interval": 10}]}
+
+plus optional "replications" (per configuration) and "seed" (master seed) entries. Parameters use
+their command-line names; anything not given keeps its command-line value.
+
+Every (configuration, seed) result is cached in a content-addressed store, so repeating or
+extending a sweep only runs the new points. The combined results are written as one CSV table.
+
+Usage:
+    python sweep.py sweep.json --output Data/sweep.csv --workers 4
+"""
+
+import os
+import csv
+import json
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from main import replication_seeds, run_batch
+from results import flatten_result, write_json_atomic
+from utils import SimulationConfig, build_parser, configure_logging
+
+# Bump when a change to the simulator makes cached results stale.
+CACHE_VERSION = 2
+
+
+def grid_design(space):
+    """
+    Builds the full factorial design of the given parameter values.
+
+    Parameters:
+        space (dict[str, list]): Values to try for each parameter.
+
+    Returns:
+        list[dict]: One configuration per combination of values.
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def latin_hypercube_design(ranges, samples, seed=None):
+    """
+    Builds a Latin hypercube design: every parameter range is split into `samples` strata and
+    each stratum is sampled exactly once.
+
+    Parameters whose bounds are both integers are rounded to integers.
+
+    Parameters:
+        ranges (dict[str, list]): [low, high] bounds of each parameter.
+        samples (int): Number of configurations.
+        seed (int): Seed of the design.
+
+    Returns:
+        list[dict]: The sampled configurations.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, (low, high) in ranges.items():
+        points = (rng.permutation(samples) + rng.random(samples)) / samples
+        values = low + points * (high - low)
+        if isinstance(low, int) and isinstance(high, int):
+            columns[name] = [int(round(value)) for value in values]
+        else:
+            columns[name] = values.tolist()
+    return [{name: columns[name][i] for name in ranges} for i in range(samples)]
+
+
+def design_from_spec(spec):
+    """
+    Builds the configurations described by a sweep spec.
+
+    Parameters:
+        spec (dict): The sweep spec (see the module docstring).
+
+    Returns:
+        list[dict]: The configurations of the sweep.
+    """
+    if "grid" in spec:
+        return grid_design(spec["grid"])
+    if "latin_hypercube" in spec:
+        design = spec["latin_hypercube"]
+        return latin_hypercube_design(design["ranges"], design["samples"], spec.get("seed"))
+    if "configs" in spec:
+        return list(spec["configs"])
+    raise ValueError("A sweep spec needs a 'grid', 'latin_hypercube' or 'configs' entry.")
+
+
+def result_options(config):
+    """
+    Returns the run options of a configuration that change its results beyond the model parameters,
+    e.g. the steady-state entry added by KPI sampling or the snapshot the runs start from.
+
+    Parameters:
+        config (SimulationConfig): The configuration.
+
+    Returns:
+        dict: The options that are set, by command-line name.
+    """
+    options = {}
+    if config.SAMPLE_INTERVAL > 0:
+        options["sample_interval"] = config.SAMPLE_INTERVAL
+    if config.INSTRUMENT:
+        options["instrument"] = True
+    if config.FROM_SNAPSHOT is not None:
+        # Keyed by content, so a snapshot saved again under the same name is not mistaken for the old one.
+        with open(config.FROM_SNAPSHOT, "rb") as file:
+            options["snapshot"] = hashlib.sha256(file.read()).hexdigest()
+    return options
+
+
+class ResultCache:
+    """
+    Content-addressed store of replication results, keyed by the full configuration and seed.
+    """
+    def __init__(self, folder="Data/cache"):
+        """
+        Parameters:
+            folder (str): Folder of the store.
+        """
+        self.folder = folder
+
+    @staticmethod
+    def key(parameters, seed, options=None):
+        """
+        Computes the key of a result.
+
+        Parameters:
+            parameters (dict): Every model parameter of the run (see SimulationConfig.parameters()).
+            seed (int): Seed of the replication.
+            options (dict): Run options that change the result (see result_options()).
+
+        Returns:
+            str: Hex digest identifying the result.
+        """
+        key = {"version": CACHE_VERSION, "parameters": parameters, "seed": seed}
+        if options:
+            key["options"] = options
+        content = json.dumps(key, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}.json")
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """
+        Returns the cached result of a key, or None when it was never computed.
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return json.load(file)
+
+    def put(self, key, result):
+        """
+        Stores a result. The file is written under a temporary name and renamed, so an
+        interrupted sweep never leaves a partial entry behind.
+        """
+        write_json_atomic(self._path(key), result)
+
+
+def run_sweep(base_config, configs, replications, seed=0, cache=None):
+    """
+    Runs every configuration of a design, skipping (configuration, seed) pairs already cached.
+
+    Every configuration uses the same replication seeds, so configurations are compared on
+    common random numbers.
+
+    Parameters:
+        base_config (SimulationConfig): Configuration the design points are applied to. Its
+            WORKERS setting is the number of worker processes (0 uses every core), and CHUNK_SIZE
+            the replications of a configuration handed to a worker at a time.
+        configs (list[dict]): The configurations, by command-line parameter name.
+        replications (int): Replications per configuration.
+        seed (int): Master seed of the sweep.
+        cache (ResultCache): Result store. Defaults to Data/cache.
+
+    Yields:
+        tuple[dict, int, int, dict]: The full parameters, replication index, seed and result of every run.
+    """
+    cache = ResultCache() if cache is None else cache
+    seeds = replication_seeds(seed, replications)
+    options = result_options(base_config)
+
+    points = []
+    for point in configs:
+        config = base_config.with_parameters(**point)
+        parameters = config.parameters()
+        keys = [cache.key(parameters, replication_seed, options) for replication_seed in seeds]
+        missing = [i for i, key in enumerate(keys) if key not in cache]
+        points.append((config, parameters, keys, missing))
+
+    pending = [point for point in points if point[3]]
+    print(f"{len(configs)} configurations, {sum(len(missing) for *_, missing in pending)} of "
+          f"{len(configs) * replications} runs to compute")
+
+    workers = os.cpu_count() if base_config.WORKERS == 0 else base_config.WORKERS
+    if pending:
+        # Split the missing runs of every configuration into chunks, so a few configurations with
+        # many replications still keep every worker busy.
+        chunk_size = max(1, base_config.CHUNK_SIZE)
+        tasks = [(point, missing[start:start + chunk_size]) for point in pending
+                 for start in range(0, len(missing), chunk_size)]
+        config_list = [config for (config, *_), _ in tasks]
+        seed_lists = [[seeds[i] for i in chunk] for _, chunk in tasks]
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        computed = (pool.map(run_batch, config_list, seed_lists) if pool
+                    else map(run_batch, config_list, seed_lists))
+        try:
+            for ((_, parameters, keys, missing), chunk), results in zip(tasks, computed):
+                for i, result in zip(chunk, results):
+                    cache.put(keys[i], result)
+                if chunk[-1] == missing[-1]:
+                    print(f"Computed {len(missing)} runs of {json.dumps(parameters)}")
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+    for _, parameters, keys, _ in points:
+        for i, key in enumerate(keys):
+            yield parameters, i, seeds[i], cache.get(key)
+
+
+def write_table(rows, path):
+    """
+    Writes sweep results as one CSV table: the parameters, replication and seed of each run
+    followed by its flattened metrics (per-station values get one column per station).
+
+    Parameters:
+        rows (Iterable[tuple[dict, int, int, dict]]): Runs as yielded by run_sweep(). Columns missing
+                                                      from a run are left empty.
+        path (str): Path of the CSV file.
+    """
+    table = []
+    fieldnames = {}
+    for parameters, replication, seed, result in rows:
+        row = {name: json.dumps(value) if isinstance(value, list) else value
+               for name, value in parameters.items()}
+        row["replication"] = replication
+        row["seed"] = seed
+        for name, value in flatten_result(result).items():
+            if isinstance(value, list):
+                row.update({f"{name}_{i + 1}": item for i, item in enumerate(value)})
+            else:
+                row[name] = value
+        table.append(row)
+        # Results may differ in columns (e.g. runs with and without KPI sampling): keep every one of them.
+        fieldnames.update(dict.fromkeys(row))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(fieldnames))
+        writer.writeheader()
+        writer.writerows(table)
+    print(f"Sweep results successfully exported to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manufacturing Facility Simulation parameter sweeps",
+                                     parents=[build_parser(add_help=False)])
+    parser.add_argument("spec", help="Path of the JSON sweep spec")
+    parser.add_argument("--output", default="Data/sweep.csv", help="Path of the combined results table")
+    parser.add_argument("--cache", default="Data/cache", help="Folder of the result cache")
+    args = parser.parse_args()
+    configure_logging(args.verbosity)
+
+    with open(args.spec) as file:
+        spec = json.load(file)
+    rows = run_sweep(SimulationConfig.from_args(args), design_from_spec(spec), spec.get("replications", 1),
+                     spec.get("seed", 0), ResultCache(args.cache))
+    write_table(rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Regression test of the event engine: a seed must give the same replication as on the SimPy engine.
+
+Usage:
+    python -m pytest test_eventcore.py
+"""
+
+import pytest
+
+from eventcore import run_event_simulations
+from main import run_simulation
+from utils import SimulationConfig, build_parser
+
+CONFIGS = {
+    "default": [],
+    "accidents": ["--accident_prob", "0.005"],
+    "conwip": ["--wip_limit", "8", "--accident_prob", "0.002"],
+    "balk": ["--wip_limit", "8", "--admission", "balk", "--accident_prob", "0.002"],
+    "restock_contention": ["--restock_devices_count", "1", "--bin_capacity", "2", "--restock_time_mean", "4"],
+}
+SEEDS = [0, 1, 2]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("name", CONFIGS)
+def test_event_engine_matches_simpy(name, seed):
+    config = SimulationConfig.from_args(build_parser().parse_args(["--simulation_time", "400"] + CONFIGS[name]))
+    assert run_simulation(config, seed) == run_event_simulations(config, [seed])[0]
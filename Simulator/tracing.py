@@ -0,0 +1,135 @@
+"""
+The tracing module contains the event trace points of the simulator and the sinks that record them.
+
+Trace points in the hot path are guarded by a single truthiness check on `facility.trace`,
+which is None unless tracing is enabled, so a disabled trace costs no string formatting or calls.
+"""
+
+import os
+import logging
+
+import numpy as np
+
+# Event codes recorded by the trace points.
+REQUEST = 0
+MATERIAL = 1
+RESTOCK_REQUESTED = 2
+PROCESSED = 3
+MAINTENANCE_REQUIRED = 4
+MAINTENANCE_STARTED = 5
+MAINTENANCE_COMPLETED = 6
+RESTOCKED = 7
+PHASE_STARTED = 8
+PHASE_COMPLETED = 9
+ACCEPTED = 10
+REJECTED = 11
+BALKED = 12
+
+EVENT_NAMES = {
+    REQUEST: "requests station",
+    MATERIAL: "got material",
+    RESTOCK_REQUESTED: "restock requested",
+    PROCESSED: "processed",
+    MAINTENANCE_REQUIRED: "requires maintenance",
+    MAINTENANCE_STARTED: "maintenance started",
+    MAINTENANCE_COMPLETED: "maintenance completed",
+    RESTOCKED: "restocked",
+    PHASE_STARTED: "starts phase",
+    PHASE_COMPLETED: "completes phase",
+    ACCEPTED: "accepted",
+    REJECTED: "rejected",
+    BALKED: "balked",
+}
+
+# One record per trace point; station is -1 and product is -1 when they do not apply.
+TRACE_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("event", "u1"),
+    ("product", "<i4"),
+    ("station", "i1"),
+    ("value", "<f4"),
+])
+
+
+class LogTraceSink:
+    """
+    Sends trace points to the logging module at debug level, formatted only when emitted.
+    """
+    def __call__(self, event, time, product=-1, station=-1, value=0.0):
+        logging.debug("%s product=%d station=%d value=%.2f %.2f",
+                      EVENT_NAMES[event], product, station + 1, value, time)
+
+    def close(self):
+        pass
+
+
+class BinaryTraceSink:
+    """
+    Writes trace points as fixed-size binary records (see TRACE_DTYPE) into a file.
+
+    Records are collected in a preallocated numpy buffer and appended to the file whenever it fills up.
+    """
+    def __init__(self, path, buffer_size=65536):
+        """
+        Opens the trace file, replacing a previous one.
+
+        Parameters:
+            path (str): Path of the trace file.
+            buffer_size (int): Number of records buffered before they are written out.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file = open(path, "wb")
+        self._buffer = np.empty(buffer_size, dtype=TRACE_DTYPE)
+        self._count = 0
+
+    def __call__(self, event, time, product=-1, station=-1, value=0.0):
+        self._buffer[self._count] = (time, event, product, station, value)
+        self._count += 1
+        if self._count == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to the file.
+        """
+        self._buffer[:self._count].tofile(self._file)
+        self._count = 0
+
+    def close(self):
+        """
+        Writes the remaining records and closes the file.
+        """
+        self.flush()
+        self._file.close()
+
+
+def make_trace_sink(trace_dir, seed):
+    """
+    Creates the trace sink of one replication, or None when tracing is disabled.
+
+    Parameters:
+        trace_dir (str): Directory for binary traces. Falls back to debug logging when None.
+        seed (int): Seed of the replication, used to name its trace file.
+
+    Returns:
+        BinaryTraceSink | LogTraceSink | None: The sink, or None when nothing would be recorded.
+    """
+    if trace_dir is not None:
+        return BinaryTraceSink(os.path.join(trace_dir, f"trace_{seed}.bin"))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        return LogTraceSink()
+    return None
+
+
+def load_trace(path):
+    """
+    Loads a binary trace file.
+
+    Parameters:
+        path (str): Path of the trace file.
+
+    Returns:
+        numpy.ndarray: Structured array of TRACE_DTYPE records; each field is a column (e.g. trace["time"]).
+    """
+    return np.fromfile(path, dtype=TRACE_DTYPE)
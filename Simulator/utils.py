@@ -3,105 +3,498 @@ The utils module contains the definitions for the simulator and configuration cl
 """
 
 import simpy
-import random
+import numpy as np
 import logging
 import argparse
+from typing import NamedTuple, Optional
 
 import argparse
 import logging
 
+import tracing
+from tracing import make_trace_sink
 
-class SimulationConfig:
+
+def build_parser(add_help=True):
     """
-    Singleton class that handles argument passing and configuration settings
-    for the Manufacturing Facility Simulation.
+    Builds the command-line parser of the simulation settings.
+
+    Scripts that add their own options pass it as a parent parser (with add_help=False).
+
+    Parameters:
+        add_help (bool): Whether the parser handles -h/--help itself.
+
+    Returns:
+        argparse.ArgumentParser: The parser; feed its result to SimulationConfig.from_args().
+    """
+    parser = argparse.ArgumentParser(description="Manufacturing Facility Simulation", add_help=add_help)
+    parser.add_argument("--bin_capacity", type=int, default=25, help="Capacity of bins")
+    parser.add_argument("--restock_devices_count", type=int, default=3, help="Number of restock devices")
+    parser.add_argument("--restock_time_mean", type=float, default=2, help="Mean restock time")
+    parser.add_argument("--maintenance_check_interval", type=int, default=5, help="Interval for maintenance checks")
+    parser.add_argument("--maintenance_time_mean", type=float, default=3, help="Mean maintenance time")
+    parser.add_argument("--processing_time_mean", type=float, default=4, help="Mean processing time")
+    parser.add_argument("--rejection_prob", type=float, default=0.05, help="Probability of product rejection")
+    parser.add_argument("--accident_prob", type=float, default=0.0001, help="Probability of an accident occurring")
+    parser.add_argument("--simulation_time", type=int, default=5000, help="Total simulation time")
+    parser.add_argument("--verbosity", type=int, default=100, help="Logging level")
+    parser.add_argument("--iterations", type=int, default=1, help="Number of iterations")
+    parser.add_argument("--plot", type=bool, default=False, help="Enable graphic plots")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for replications (0 uses every core)")
+    parser.add_argument("--chunk_size", type=int, default=1, help="Replications handed to a worker at a time")
+    parser.add_argument("--seed", type=int, default=None, help="Master seed for the replication seed streams")
+    parser.add_argument("--engine", choices=["simpy", "fast", "event"], default="simpy",
+                        help="Simulation engine: SimPy processes, the vectorized fast path or the heap-based event engine")
+    parser.add_argument("--columns", action="store_true",
+                        help="Also export the results as a columnar NPZ archive")
+    parser.add_argument("--trace_dir", type=str, default=None,
+                        help="Directory for binary event traces (one file per replication)")
+    parser.add_argument("--arrival_interval", type=float, default=1, help="Time between product releases")
+    parser.add_argument("--wip_limit", type=int, default=0, help="Maximum products in the line (0 for no limit)")
+    parser.add_argument("--admission", choices=["conwip", "balk"], default="conwip",
+                        help="What happens to arrivals at the WIP limit: wait for a token or be turned away")
+    parser.add_argument("--rng_block_size", type=int, default=1024, help="Random variates pre-drawn per block")
+    parser.add_argument("--precision", type=float, default=None,
+                        help="Replicate until every CI half-width is within this fraction of its mean "
+                             "(overrides --iterations)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    parser.add_argument("--min_replications", type=int, default=10, help="Replications before checking --precision")
+    parser.add_argument("--max_replications", type=int, default=10000, help="Replication cap of --precision runs")
+    parser.add_argument("--ci_metrics", nargs="+",
+                        default=["accepted_products", "avg_delay_time", "occupancy_per_workstation"],
+                        help="Metrics whose confidence intervals --precision waits for")
+    parser.add_argument("--sample_interval", type=float, default=0,
+                        help="Time between KPI samples for warm-up detection (0 disables sampling)")
+    parser.add_argument("--series_dir", type=str, default=None,
+                        help="Directory for the sampled KPI series (one NPZ archive per replication)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its checkpointed results")
+    parser.add_argument("--save_snapshot", type=str, default=None,
+                        help="Run one replication to --simulation_time and save the facility state to this file")
+    parser.add_argument("--from_snapshot", type=str, default=None,
+                        help="Start every replication from a facility state saved with --save_snapshot")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Count events per type and process, peak queues and memory of every replication")
+    parser.add_argument("--profile", dest="profile_dir", type=str, default=None,
+                        help="Directory for cProfile output (one .prof file per replication)")
+    return parser
+
+
+def configure_logging(verbosity):
     """
-    _instance = None
+    Configures the logging module with the --verbosity level of the command line.
 
-    def __new__(cls):
+    Parameters:
+        verbosity (int): The logging level.
+    """
+    logging.basicConfig(level=verbosity, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class SimulationConfig(NamedTuple):
+    """
+    Immutable configuration settings for the Manufacturing Facility Simulation.
+
+    A configuration is built once (from the command line with from_args(), or from the
+    defaults) and handed to ManufacturingFacility, which the simulation processes read it
+    from. Several configurations can live in one process; derive variants with with_parameters().
+    """
+    NUM_STATIONS: int = 6
+    BIN_CAPACITY: int = 25
+    RESTOCK_DEVICES: int = 3
+    RESTOCK_TIME: float = 2
+    MAINTENANCE_INTERVAL: int = 5
+    MAINTENANCE_TIME: float = 3
+    PROCESSING_TIME: float = 4
+    REJECTION_PROB: float = 0.05
+    ACCIDENT_PROB: float = 0.0001
+    SIMULATION_TIME: int = 5000
+    STATION_FAILURE_PROBS: tuple = (0.02, 0.01, 0.05, 0.15, 0.07, 0.06)
+    PLOTTING: bool = False
+    ITERATIONS: int = 1
+    WORKERS: int = 1
+    CHUNK_SIZE: int = 1
+    SEED: Optional[int] = None
+    RNG_BLOCK_SIZE: int = 1024
+    ENGINE: str = "simpy"
+    COLUMNS: bool = False
+    TRACE_DIR: Optional[str] = None
+    ARRIVAL_INTERVAL: float = 1
+    WIP_LIMIT: int = 0
+    ADMISSION: str = "conwip"
+    PRECISION: Optional[float] = None
+    CONFIDENCE: float = 0.95
+    MIN_REPLICATIONS: int = 10
+    MAX_REPLICATIONS: int = 10000
+    CI_METRICS: tuple = ("accepted_products", "avg_delay_time", "occupancy_per_workstation")
+    SAMPLE_INTERVAL: float = 0
+    SERIES_DIR: Optional[str] = None
+    RESUME: bool = False
+    SAVE_SNAPSHOT: Optional[str] = None
+    FROM_SNAPSHOT: Optional[str] = None
+    INSTRUMENT: bool = False
+    PROFILE_DIR: Optional[str] = None
+
+    # Model parameters by their command-line name, as used by parameter sweeps.
+    PARAMETERS = {
+        "bin_capacity": "BIN_CAPACITY",
+        "restock_devices_count": "RESTOCK_DEVICES",
+        "restock_time_mean": "RESTOCK_TIME",
+        "maintenance_check_interval": "MAINTENANCE_INTERVAL",
+        "maintenance_time_mean": "MAINTENANCE_TIME",
+        "processing_time_mean": "PROCESSING_TIME",
+        "rejection_prob": "REJECTION_PROB",
+        "accident_prob": "ACCIDENT_PROB",
+        "simulation_time": "SIMULATION_TIME",
+        "station_failure_probs": "STATION_FAILURE_PROBS",
+        "arrival_interval": "ARRIVAL_INTERVAL",
+        "wip_limit": "WIP_LIMIT",
+        "admission": "ADMISSION",
+        "engine": "ENGINE",
+    }
+
+    @classmethod
+    def from_args(cls, args):
         """
-        Ensures only one instance of SimulationConfig exists.
+        Creates a configuration from parsed command-line arguments.
 
         Parameters:
-            cls (Type[SimulationConfig]): The class reference.
+            args (argparse.Namespace): The result of build_parser().parse_args().
 
         Returns:
-            SimulationConfig: The singleton instance.
+            SimulationConfig: The configuration.
         """
+        return cls(
+            BIN_CAPACITY=args.bin_capacity,
+            RESTOCK_DEVICES=args.restock_devices_count,
+            RESTOCK_TIME=args.restock_time_mean,
+            MAINTENANCE_INTERVAL=args.maintenance_check_interval,
+            MAINTENANCE_TIME=args.maintenance_time_mean,
+            PROCESSING_TIME=args.processing_time_mean,
+            REJECTION_PROB=args.rejection_prob,
+            ACCIDENT_PROB=args.accident_prob,
+            SIMULATION_TIME=args.simulation_time,
+            PLOTTING=args.plot,
+            ITERATIONS=args.iterations,
+            WORKERS=args.workers,
+            CHUNK_SIZE=args.chunk_size,
+            SEED=args.seed,
+            RNG_BLOCK_SIZE=args.rng_block_size,
+            ENGINE=args.engine,
+            COLUMNS=args.columns,
+            TRACE_DIR=args.trace_dir,
+            ARRIVAL_INTERVAL=args.arrival_interval,
+            WIP_LIMIT=args.wip_limit,
+            ADMISSION=args.admission,
+            PRECISION=args.precision,
+            CONFIDENCE=args.confidence,
+            MIN_REPLICATIONS=args.min_replications,
+            MAX_REPLICATIONS=args.max_replications,
+            CI_METRICS=tuple(args.ci_metrics),
+            SAMPLE_INTERVAL=args.sample_interval,
+            SERIES_DIR=args.series_dir,
+            RESUME=args.resume,
+            SAVE_SNAPSHOT=args.save_snapshot,
+            FROM_SNAPSHOT=args.from_snapshot,
+            INSTRUMENT=args.instrument,
+            PROFILE_DIR=args.profile_dir,
+        )
+
+    def parameters(self):
         """
-        Ensures only one instance of SimulationConfig exists.
+        Returns the model parameters by their command-line name.
 
         Returns:
-            SimulationConfig: The singleton instance.
-        """
-        if cls._instance is None:
-            cls._instance = super(SimulationConfig, cls).__new__(cls)
-            cls._instance._init_params()
-        return cls._instance
-
-    def _init_params(self):
-        """
-        Initializes simulation parameters by parsing command-line arguments.
-        """
-        parser = argparse.ArgumentParser(description="Manufacturing Facility Simulation")
-        parser.add_argument("--bin_capacity", type=int, default=25, help="Capacity of bins")
-        parser.add_argument("--restock_devices_count", type=int, default=3, help="Number of restock devices")
-        parser.add_argument("--restock_time_mean", type=float, default=2, help="Mean restock time")
-        parser.add_argument("--maintenance_check_interval", type=int, default=5, help="Interval for maintenance checks")
-        parser.add_argument("--maintenance_time_mean", type=float, default=3, help="Mean maintenance time")
-        parser.add_argument("--processing_time_mean", type=float, default=4, help="Mean processing time")
-        parser.add_argument("--rejection_prob", type=float, default=0.05, help="Probability of product rejection")
-        parser.add_argument("--accident_prob", type=float, default=0.0001, help="Probability of an accident occurring")
-        parser.add_argument("--simulation_time", type=int, default=5000, help="Total simulation time")
-        parser.add_argument("--verbosity", type=int, default=100, help="Logging level")
-        parser.add_argument("--iterations", type=int, default=1, help="Number of iterations")
-        parser.add_argument("--plot", type=bool, default=False, help="Enable graphic plots")
-
-        args = parser.parse_args()
-
-        self.NUM_STATIONS = 6
-        self.BIN_CAPACITY = args.bin_capacity
-        self.RESTOCK_DEVICES = args.restock_devices_count
-        self.RESTOCK_TIME = args.restock_time_mean
-        self.MAINTENANCE_INTERVAL = args.maintenance_check_interval
-        self.MAINTENANCE_TIME = args.maintenance_time_mean
-        self.PROCESSING_TIME = args.processing_time_mean
-        self.REJECTION_PROB = args.rejection_prob
-        self.ACCIDENT_PROB = args.accident_prob
-        self.SIMULATION_TIME = args.simulation_time
-        self.STATION_FAILURE_PROBS = [0.02, 0.01, 0.05, 0.15, 0.07, 0.06]
-        self.PLOTTING = args.plot
-        self.ITERATIONS = args.iterations
-
-        logging.basicConfig(level=args.verbosity, format='%(asctime)s - %(levelname)s - %(message)s')
+            dict: Parameter name -> value, for every entry of PARAMETERS.
+        """
+        return {name: getattr(self, field) for name, field in self.PARAMETERS.items()}
+
+    def with_parameters(self, **parameters):
+        """
+        Returns a copy of the configuration with some model parameters replaced.
+
+        Parameters:
+            **parameters: New values by command-line name (see PARAMETERS).
+
+        Returns:
+            SimulationConfig: The new configuration.
+        """
+        unknown = set(parameters) - set(self.PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown simulation parameters: {', '.join(sorted(unknown))}")
+        return self._replace(**{self.PARAMETERS[name]: tuple(value) if isinstance(value, list) else value
+                                for name, value in parameters.items()})
+
+
+class VariateStream:
+    """
+    Hands out standard variates from a numpy generator, pre-drawn in blocks to avoid
+    paying for a numpy call on every event.
+    """
+    __slots__ = ("_draw", "_block_size", "_block", "_index")
+
+    def __init__(self, draw, block_size):
+        """
+        Initializes the stream.
+
+        Parameters:
+            draw (Callable[[int], numpy.ndarray]): Draws the given number of standard variates.
+            block_size (int): Number of variates drawn at once.
+        """
+        self._draw = draw
+        self._block_size = block_size
+        self._block = []
+        self._index = 0
+
+    def next(self):
+        """
+        Returns the next variate of the stream, drawing a new block when the current one is used up.
+
+        Returns:
+            float: The next standard variate.
+        """
+        index = self._index
+        if index == len(self._block):
+            self._block = self._draw(self._block_size).tolist()
+            index = 0
+        self._index = index + 1
+        return self._block[index]
+
+    def take(self, size):
+        """
+        Returns the next variates of the stream as an array, continuing where next() left off.
+
+        Parameters:
+            size (int): Number of variates.
+
+        Returns:
+            numpy.ndarray: The next `size` standard variates.
+        """
+        head = self._block[self._index:self._index + size]
+        self._index += len(head)
+        if len(head) == size:
+            return np.array(head)
+        return np.concatenate([head, self._draw(size - len(head))])
+
+    def get_state(self):
+        """
+        Returns the position of the stream: the state of its generator and the unused part of its block.
+
+        Returns:
+            dict: JSON-serializable state, for set_state().
+        """
+        return {"generator": self._draw.__self__.bit_generator.state,
+                "block": self._block[self._index:]}
+
+    def set_state(self, state):
+        """
+        Moves the stream to a position returned by get_state().
+
+        Parameters:
+            state (dict): The state to restore.
+        """
+        self._draw.__self__.bit_generator.state = state["generator"]
+        self._block = list(state["block"])
+        self._index = 0
+
+
+class RandomStreams:
+    """
+    Seedable random number generation for one replication, with an independent substream
+    per source of randomness.
+
+    Every source owns its own generator, so changing how often one source is used (e.g. a
+    different maintenance interval) does not shift the numbers drawn by the others. Processing,
+    restock, failure and repair draws also have one substream per station, so the n-th visit of
+    a station gets the same draws whatever order events of other stations happen in. Streams
+    hold standard variates that are scaled on use, which keeps them synchronized across
+    configurations for common random numbers.
+    """
+    SOURCES = ("processing", "restock", "maintenance", "routing", "rejection", "accidents")
+
+    def __init__(self, seed=None, block_size=1024, stations=6):
+        """
+        Spawns the substreams from the given seed.
+
+        Parameters:
+            seed (int): Seed of the replication. Fresh entropy is used when None.
+            block_size (int): Number of variates pre-drawn per block.
+            stations (int): Number of stations, each with its own processing, restock, failure and repair substream.
+        """
+        seed_sequence = np.random.SeedSequence(seed)
+        self.seed = seed_sequence.entropy
+        processing, restock, maintenance, routing, rejection, accidents = seed_sequence.spawn(len(self.SOURCES))
+        failure, repair = maintenance.spawn(2)
+        self.processing = [VariateStream(np.random.default_rng(child).standard_normal, block_size)
+                           for child in processing.spawn(stations)]
+        self.restock = [VariateStream(np.random.default_rng(child).standard_normal, block_size)
+                        for child in restock.spawn(stations)]
+        self.failure = [VariateStream(np.random.default_rng(child).random, block_size) for child in failure.spawn(stations)]
+        self.repair = [VariateStream(np.random.default_rng(child).standard_exponential, block_size)
+                       for child in repair.spawn(stations)]
+        self.routing = VariateStream(np.random.default_rng(routing).random, block_size)
+        self.rejection = VariateStream(np.random.default_rng(rejection).random, block_size)
+        self.accidents = VariateStream(np.random.default_rng(accidents).random, block_size)
+
+    # Substreams by attribute name, as saved by get_state(), and those kept per station.
+    STREAMS = ("processing", "restock", "failure", "repair", "routing", "rejection", "accidents")
+    STATION_STREAMS = ("processing", "restock", "failure", "repair")
+
+    def get_state(self):
+        """
+        Returns the position of every substream.
+
+        Returns:
+            dict: JSON-serializable state, for set_state().
+        """
+        return {name: [stream.get_state() for stream in getattr(self, name)] if name in self.STATION_STREAMS
+                else getattr(self, name).get_state()
+                for name in self.STREAMS}
+
+    def set_state(self, state):
+        """
+        Moves every substream to a position returned by get_state().
+
+        Parameters:
+            state (dict): The state to restore.
+        """
+        for name in self.STREAMS:
+            if name in self.STATION_STREAMS:
+                for stream, stream_state in zip(getattr(self, name), state[name]):
+                    stream.set_state(stream_state)
+            else:
+                getattr(self, name).set_state(state[name])
+
+    def processing_time(self, station, mean):
+        """Draws a processing time at a station, normally distributed around the mean and clipped at zero."""
+        return max(0, mean + 0.5 * self.processing[station].next())
+
+    def restock_time(self, station, mean):
+        """Draws the restock time of a station's bin, normally distributed around the mean and clipped at zero."""
+        return max(0, mean + 0.5 * self.restock[station].next())
+
+    def station_fails(self, station, prob):
+        """Returns True if a station fails its maintenance check."""
+        return self.failure[station].next() < prob
+
+    def maintenance_time(self, station, mean):
+        """Draws an exponentially distributed maintenance time of a station."""
+        return mean * self.repair[station].next()
+
+    def station_4_first(self):
+        """Returns True if a product visits station 4 before station 5."""
+        return self.routing.next() < 0.5
+
+    def product_rejected(self, prob):
+        """Returns True if a product fails the final quality check."""
+        return self.rejection.next() < prob
+
+    def accident_happens(self, prob):
+        """Returns True if an accident happens in the current time unit."""
+        return self.accidents.next() < prob
 
 
 class ManufacturingFacility:
     """
     Defines the model of a facility, and holds the informetion of the key performance metrics
     """
-    def __init__(self, env):
+    def __init__(self, env, config, seed=None):
         """
         Initializes the manufacturing facility with stations, bins, restock devices, and performance metrics.
 
         Parameters:
             env (simpy.Environment): The simulation environment.
+            config (SimulationConfig): The configuration of the simulation.
+            seed (int): Seed of the facility's random streams. Fresh entropy is used when None.
         """
         self.env = env
-        self.stations = [simpy.Resource(env) for _ in range(SimulationConfig().NUM_STATIONS)]
-        self.bins = [simpy.Container(env, SimulationConfig().BIN_CAPACITY, init=SimulationConfig().BIN_CAPACITY)
-                     for _ in range(SimulationConfig().NUM_STATIONS)]
-        self.restock_devices = simpy.Resource(env, SimulationConfig().RESTOCK_DEVICES)
-        self.station_counts = [0] * SimulationConfig().NUM_STATIONS
+        self.config = config
+        self.streams = RandomStreams(seed, config.RNG_BLOCK_SIZE, config.NUM_STATIONS)
+        # None unless tracing is enabled, so trace points cost a single check on the hot path.
+        self.trace = make_trace_sink(config.TRACE_DIR, self.streams.seed)
+        self.stations = [simpy.Resource(env) for _ in range(config.NUM_STATIONS)]
+        self.bins = [simpy.Container(env, config.BIN_CAPACITY, init=config.BIN_CAPACITY)
+                     for _ in range(config.NUM_STATIONS)]
+        self.restock_devices = simpy.Resource(env, config.RESTOCK_DEVICES)
+        self.station_counts = [0] * config.NUM_STATIONS
         self.accepted_products = 0
         self.rejected_products = 0
-        self.station_busy_time = [0.0] * SimulationConfig().NUM_STATIONS
-        self.maintenance_downtime = [0.0] * SimulationConfig().NUM_STATIONS
+        self.station_busy_time = [0.0] * config.NUM_STATIONS
+        self.maintenance_downtime = [0.0] * config.NUM_STATIONS
         self.restock_device_busy_time = 0.0
         self.total_maintenance_time = 0.0
         self.total_maintenance_events = 0
-        self.station_waiting_time = [0.0] * SimulationConfig().NUM_STATIONS
-        self.bin_waiting_time = [0.0] * SimulationConfig().NUM_STATIONS
+        self.station_waiting_time = [0.0] * config.NUM_STATIONS
+        self.bin_waiting_time = [0.0] * config.NUM_STATIONS
+        self.balked_products = 0
+        self.next_product_id = 0
+        # Products in the line: product id -> [route, step in the route, time it requested its current station].
+        self.products = {}
+        # CONWIP token pool: a product holds a token from release until it leaves the line.
+        self.wip_tokens = (simpy.Container(env, config.WIP_LIMIT, init=config.WIP_LIMIT)
+                           if config.WIP_LIMIT > 0 else None)
+
+    # Counters carried over by snapshot() and from_snapshot().
+    SNAPSHOT_COUNTERS = (
+        "station_counts", "accepted_products", "rejected_products", "station_busy_time",
+        "maintenance_downtime", "restock_device_busy_time", "total_maintenance_time",
+        "total_maintenance_events", "station_waiting_time", "bin_waiting_time", "balked_products",
+        "next_product_id",
+    )
+
+    def snapshot(self):
+        """
+        Captures the state of the facility: the time, bin levels, counters, the products in the
+        line with their position, and the position of every random stream.
+
+        Returns:
+            dict: JSON-serializable snapshot, for from_snapshot().
+        """
+        return {
+            "time": self.env.now,
+            "seed": self.streams.seed,
+            "bin_levels": [bin.level for bin in self.bins],
+            "counters": {name: getattr(self, name) for name in self.SNAPSHOT_COUNTERS},
+            "products": [{"id": product_id, "route": list(route), "step": step, "requested_at": requested_at}
+                         for product_id, (route, step, requested_at) in self.products.items()],
+            "streams": self.streams.get_state(),
+        }
+
+    @classmethod
+    def from_snapshot(cls, env, config, snapshot, seed=None):
+        """
+        Recreates a facility from a snapshot and restarts the work that was in progress.
+
+        Products re-enter their current station in the order they requested it, so queues keep
+        their order; products that were being served start their current operation over. Empty
+        bins are sent for restocking again. The configuration may differ from the one the
+        snapshot was taken with, which forks what-if branches from one warmed-up state.
+
+        Parameters:
+            env (simpy.Environment): The environment to continue in, created with initial_time=snapshot["time"].
+            config (SimulationConfig): The configuration of the branch.
+            snapshot (dict): A snapshot returned by snapshot().
+            seed (int): Seed of the branch's random streams. The snapshot's streams continue where
+                        they left off when None.
+
+        Returns:
+            ManufacturingFacility: The facility, with its products and restocks already scheduled.
+        """
+        facility = cls(env, config, snapshot["seed"] if seed is None else seed)
+        if seed is None:
+            facility.streams.set_state(snapshot["streams"])
+        facility.bins = [simpy.Container(env, config.BIN_CAPACITY, init=min(level, config.BIN_CAPACITY))
+                         for level in snapshot["bin_levels"]]
+        for name, value in snapshot["counters"].items():
+            setattr(facility, name, list(value) if isinstance(value, list) else value)
+        products = sorted(snapshot["products"], key=lambda product: (product["requested_at"], product["id"]))
+        if facility.wip_tokens is not None:
+            facility.wip_tokens = simpy.Container(env, config.WIP_LIMIT, init=max(config.WIP_LIMIT - len(products), 0))
+        for product in products:
+            env.process(process_product(env, facility, product["id"], tuple(product["route"]), product["step"]))
+        for station_id, bin in enumerate(facility.bins):
+            if bin.level == 0:
+                env.process(facility.restock_bin(station_id))
+        return facility
 
     def restock_bin(self, station_id):
         """
@@ -113,12 +506,13 @@ class ManufacturingFacility:
         with self.restock_devices.request() as req:
             yield req
             start_time = self.env.now
-            restock_time = max(0, random.normalvariate(SimulationConfig().RESTOCK_TIME, 0.5))
+            restock_time = self.streams.restock_time(station_id, self.config.RESTOCK_TIME)
             yield self.env.timeout(restock_time)
-            yield self.bins[station_id].put(SimulationConfig().BIN_CAPACITY)
+            yield self.bins[station_id].put(self.config.BIN_CAPACITY)
             end_time = self.env.now
             self.restock_device_busy_time += (end_time - start_time)
-            logging.debug(f"station {station_id + 1} restocked {self.env.now:.2f}")
+            if self.trace:
+                self.trace(tracing.RESTOCKED, end_time, station=station_id, value=restock_time)
 
     def perform_maintenance(self, station_id):
         """
@@ -128,16 +522,18 @@ class ManufacturingFacility:
             station_id (int): The ID of the station undergoing maintenance.
         """
         with self.stations[station_id].request() as req:
-            logging.debug(f"maintenance started at station {station_id + 1}  {self.env.now:.2f}")
             start_time = self.env.now
-            maintenance_time = random.expovariate(1 / SimulationConfig().MAINTENANCE_TIME)
+            if self.trace:
+                self.trace(tracing.MAINTENANCE_STARTED, start_time, station=station_id)
+            maintenance_time = self.streams.maintenance_time(station_id, self.config.MAINTENANCE_TIME)
             yield self.env.timeout(maintenance_time)
             end_time = self.env.now
             duration = end_time - start_time
             self.maintenance_downtime[station_id] += duration
             self.total_maintenance_time += duration
             self.total_maintenance_events += 1
-            logging.debug(f"maintenance completed at station {station_id + 1} {self.env.now:.2f}")
+            if self.trace:
+                self.trace(tracing.MAINTENANCE_COMPLETED, end_time, station=station_id, value=duration)
 
 
 def process_station(env, facility, product_id, station_id):
@@ -153,9 +549,12 @@ def process_station(env, facility, product_id, station_id):
         product_id (int): The unique identifier of the product being processed.
         station_id (int): The index of the station where processing occurs.
     """
+    config = facility.config
     bin = facility.bins[station_id]
     station = facility.stations[station_id]
-    logging.debug(f"product {product_id} requests Station {station_id + 1} {env.now:.2f}")
+    trace = facility.trace
+    if trace:
+        trace(tracing.REQUEST, env.now, product_id, station_id)
     with station.request() as req:
         station_request_start = env.now
         yield req
@@ -169,20 +568,23 @@ def process_station(env, facility, product_id, station_id):
             bin_get_end = env.now
             facility.bin_waiting_time[station_id] += (bin_get_end - bin_get_start)
 
-            logging.debug(f"product {product_id} got material from station {station_id + 1}  {env.now:.2f}")
+            if trace:
+                trace(tracing.MATERIAL, bin_get_end, product_id, station_id, bin_get_end - bin_get_start)
             if bin.level == 0:
                 env.process(facility.restock_bin(station_id))
-                logging.debug(f"restock for station {station_id + 1}  {env.now:.2f}")
+                if trace:
+                    trace(tracing.RESTOCK_REQUESTED, env.now, product_id, station_id)
 
-            processing_time = max(0, random.normalvariate(SimulationConfig().PROCESSING_TIME, 0.5))
+            processing_time = facility.streams.processing_time(station_id, config.PROCESSING_TIME)
             yield env.timeout(processing_time)
-            logging.debug(
-                f"product {product_id} processed at station {station_id + 1} in {processing_time:.2f}")
+            if trace:
+                trace(tracing.PROCESSED, env.now, product_id, station_id, processing_time)
 
             facility.station_counts[station_id] += 1
-            if facility.station_counts[station_id] % SimulationConfig().MAINTENANCE_INTERVAL == 0:
-                if random.random() < SimulationConfig().STATION_FAILURE_PROBS[station_id]:
-                    logging.debug(f"station {station_id + 1} requires maintenance {env.now:.2f}")
+            if facility.station_counts[station_id] % config.MAINTENANCE_INTERVAL == 0:
+                if facility.streams.station_fails(station_id, config.STATION_FAILURE_PROBS[station_id]):
+                    if trace:
+                        trace(tracing.MAINTENANCE_REQUIRED, env.now, product_id, station_id)
                     yield env.process(facility.perform_maintenance(station_id))
         finally:
             end_time = env.now
@@ -190,7 +592,7 @@ def process_station(env, facility, product_id, station_id):
 
 
 
-def process_product(env, facility, product_id):
+def process_product(env, facility, product_id, route=None, step=0):
     """
     Simulates the workflow of a product moving through the facility.
 
@@ -202,55 +604,70 @@ def process_product(env, facility, product_id):
         env (simpy.Environment): The simulation environment.
         facility (ManufacturingFacility): The manufacturing facility instance.
         product_id (int): The unique identifier of the product.
+        route (tuple[int]): Stations to visit, drawn at random when None.
+        step (int): Index in the route to start from (non-zero for products restored from a snapshot).
     """
-    for i in range(3):
-        yield env.process(process_station(env, facility, product_id, i))
-        logging.debug(f"product {product_id} completes phase {i + 1} {env.now:.2f}")
-
-    # Optional order through station 4 or 5
-    if random.choice([True, False]):
-        logging.debug(f"product {product_id} goes to phase 4 {env.now:.2f}")
-        yield env.process(process_station(env, facility, product_id, 3))
-        logging.debug(f"product {product_id} completes phase 4 {env.now:.2f}")
-        yield env.process(process_station(env, facility, product_id, 4))
-        logging.debug(f"product {product_id} completes phase 5 {env.now:.2f}")
-    else:
-        logging.debug(f"product {product_id} goes to phase 5 {env.now:.2f}")
-        yield env.process(process_station(env, facility, product_id, 4))
-        logging.debug(f"product {product_id} completes phase 5 {env.now:.2f}")
-        yield env.process(process_station(env, facility, product_id, 3))
-        logging.debug(f"product {product_id} completes phase 4 {env.now:.2f}")
-
-    logging.debug(f"product {product_id} starts phase 6 {env.now:.2f}")
-    yield env.process(process_station(env, facility, product_id, 5))
-    logging.debug(f"product {product_id} completes phase 6 {env.now:.2f}")
-
-    if random.random() < SimulationConfig().REJECTION_PROB:
-        logging.debug(f"product {product_id} rejected {env.now:.2f}")
+    trace = facility.trace
+    if route is None:
+        # Optional order through station 4 or 5
+        route = (0, 1, 2, 3, 4, 5) if facility.streams.station_4_first() else (0, 1, 2, 4, 3, 5)
+    position = facility.products[product_id] = [route, step, env.now]
+    for step in range(step, len(route)):
+        station_id = route[step]
+        position[1] = step
+        position[2] = env.now
+        if trace:
+            trace(tracing.PHASE_STARTED, env.now, product_id, station_id)
+        yield env.process(process_station(env, facility, product_id, station_id))
+        if trace:
+            trace(tracing.PHASE_COMPLETED, env.now, product_id, station_id)
+
+    if facility.streams.product_rejected(facility.config.REJECTION_PROB):
+        if trace:
+            trace(tracing.REJECTED, env.now, product_id)
         facility.rejected_products += 1
     else:
-        logging.debug(f"product {product_id} accepted {env.now:.2f}")
+        if trace:
+            trace(tracing.ACCEPTED, env.now, product_id)
         facility.accepted_products += 1
 
+    del facility.products[product_id]
+    if facility.wip_tokens is not None:
+        facility.wip_tokens.put(1)
+
 def product_generator(env, facility):
     """
     Generates and processes products in the facility.
 
     This function continuously creates products and passes them through the
     manufacturing pipeline. Each product is assigned a unique identifier
-    and enters the system at a fixed time interval.
+    and enters the system every ARRIVAL_INTERVAL time units.
+
+    When a WIP limit is set, a product needs a token from the facility's token pool to be
+    released. Under the "conwip" policy the generator waits for a token, under "balk" the
+    arrival is turned away and counted in balked_products.
 
     Parameters:
         env (simpy.Environment): The simulation environment.
         facility (ManufacturingFacility): The manufacturing facility instance.
     """
-    product_id = 0
+    tokens = facility.wip_tokens
+    balk = facility.config.ADMISSION == "balk"
+    interval = facility.config.ARRIVAL_INTERVAL
     while True:
-        env.process(process_product(env, facility, product_id))
-        product_id += 1
-        yield env.timeout(1)
-
-def accident_monitor(env):
+        if tokens is not None:
+            if balk and tokens.level == 0:
+                if facility.trace:
+                    facility.trace(tracing.BALKED, env.now, facility.next_product_id)
+                facility.balked_products += 1
+                yield env.timeout(interval)
+                continue
+            yield tokens.get(1)
+        env.process(process_product(env, facility, facility.next_product_id))
+        facility.next_product_id += 1
+        yield env.timeout(interval)
+
+def accident_monitor(env, facility):
     """
     Monitors the simulation for random accidents.
 
@@ -259,10 +676,12 @@ def accident_monitor(env):
 
     Parameters:
         env (simpy.Environment): The simulation environment.
+        facility (ManufacturingFacility): The manufacturing facility instance.
     """
+    prob = facility.config.ACCIDENT_PROB
     while True:
         yield env.timeout(1)
-        if random.random() < SimulationConfig().ACCIDENT_PROB:
+        if facility.streams.accident_happens(prob):
             logging.error(f"Accident happened at {env.now:.2f}")
             env.process(stop_simulation(env))
 
@@ -276,4 +695,87 @@ def stop_simulation(env):
     Parameters:
         env (simpy.Environment): The simulation environment.
     """
-    raise RuntimeError("Simulation halted due to an accident.")
\ No newline at end of file
+    raise RuntimeError("Simulation halted due to an accident.")
+
+
+def collect_metrics(config, facility, actual_time, accident):
+    """
+    Computes the metrics of one replication from the counters of a facility.
+
+    Parameters:
+        config (SimulationConfig): The configuration of the simulation.
+        facility (ManufacturingFacility): The facility at the end of the run, or any object
+            with the same counters (e.g. the per-replication totals of the fast engine).
+        actual_time (float): The time the run ended.
+        accident (bool): Whether the run was halted by an accident.
+
+    Returns:
+        dict: The metrics described in run_simulation().
+    """
+    # Compute basic production metrics
+    accepted = facility.accepted_products
+    rejected = facility.rejected_products
+    total = accepted + rejected
+
+    # Production rejection percentage (by number and percentage)
+    rejection_percentage = (rejected / total * 100) if total > 0 else 0
+
+    # Average delay time: computed as the same as bottleneck delay in this example.
+    avg_delay = (sum(facility.station_waiting_time) + sum(facility.bin_waiting_time)) / total if total > 0 else 0
+
+    # Workstation status partition per station:
+    workstation_status = []
+    for i in range(config.NUM_STATIONS):
+        # Operational time is the busy time.
+        operational = facility.station_busy_time[i]
+        # Down time is recorded from maintenance downtime.
+        down_time = facility.maintenance_downtime[i]
+        # Waiting for restock (or idle) is what remains.
+        waiting = actual_time - operational
+        workstation_status.append({
+            "operational": operational,
+            "downtime": down_time,
+            "waiting_for_restock": waiting
+        })
+
+    # Analysis on bottleneck workstations using waiting times.
+    waiting_times = facility.station_waiting_time if hasattr(facility, 'station_waiting_time') else [0] * config.NUM_STATIONS
+    bottleneck_index = int(np.argmax(waiting_times)) if waiting_times else None
+    max_waiting_time = max(waiting_times) if waiting_times else 0
+    bottleneck_analysis = {
+        "waiting_times": waiting_times,
+        "bottleneck_station": bottleneck_index,
+        "max_waiting_time": max_waiting_time
+    }
+
+    # Average production time per workstation.
+    avg_production_time = []
+    for i in range(config.NUM_STATIONS):
+        if facility.station_counts[i] > 0:
+            prod_time = facility.station_busy_time[i] / facility.station_counts[i]
+        else:
+            prod_time = 0
+        avg_production_time.append(prod_time)
+
+    # Compile all metrics into the dictionary.
+    metrics = {
+        "accepted_products": accepted,
+        "rejected_products": rejected,
+        "balked_products": facility.balked_products,
+        "total_products": total,
+        "occupancy_per_workstation": [
+            facility.station_busy_time[i] / actual_time for i in range(config.NUM_STATIONS)
+        ],
+        "avg_production_time": avg_production_time,
+        "production_rejection_percentage": rejection_percentage,
+        "avg_delay_time": avg_delay,
+        "accident_rate": int(accident) * 100,  # Expressed as percentage (0 or 100)
+        "workstation_status": workstation_status,
+        "bottleneck_workstations": bottleneck_analysis,
+        "supplier_occupancy": facility.restock_device_busy_time / (actual_time * config.RESTOCK_DEVICES),
+        "avg_fix_time": facility.total_maintenance_time / facility.total_maintenance_events if facility.total_maintenance_events > 0 else 0,
+        "avg_bottleneck_delay": avg_delay,
+        "faulty_product_rate": rejected / total if total > 0 else 0,
+        "accidents": int(accident)
+    }
+    return metrics